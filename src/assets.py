@@ -0,0 +1,164 @@
+import hashlib
+import os
+import pickle
+from dataclasses import dataclass, field
+from time import perf_counter
+
+import pygame as pg
+from pygame import Surface
+
+ATLAS_CACHE_VERSION = 2
+
+
+@dataclass
+class AssetAtlas:
+    """Every sprite variant (source, size, rotation) the game uses, each decoded and scaled only once.
+
+    Variants are persisted to a cache file keyed by the source PNG hash, so later runs skip PNG decoding and scaling.
+    The file is an index followed by raw RGBA, a run only reads the variants it asks for."""
+
+    data_dir: str = "data"
+    cache_path: str | None = ".cache/atlas.pickle"
+    sources: dict[str, Surface] = field(default_factory=dict)
+    variants: dict[tuple, Surface] = field(default_factory=dict)
+
+    # Stats
+    decoded: int = 0
+    baked: int = 0
+    from_cache: int = 0
+    decode_ms: float = 0.0
+    scale_ms: float = 0.0  # Scaling and rotating
+    cache_ms: float = 0.0  # Converting variants from the cache file
+
+    def __post_init__(self):
+        self.hashes = {}
+        self.source_sizes = {}
+        self.cached = {}  # Key -> (size, offset, length) of raw RGBA after the cache file's index, read and converted on first use
+        self.cache_mtime = None  # Of the cache file the index was read from, a replaced file isn't read from
+        self.data_start = 0
+        self.dirty = False
+        self.load()
+
+    def source_hash(self, name: str) -> str:
+        if name not in self.hashes:
+            with open(f"{self.data_dir}/{name}.png", "rb") as f:
+                self.hashes[name] = hashlib.sha1(f.read()).hexdigest()
+        return self.hashes[name]
+
+    def source(self, name: str) -> Surface:
+        if name not in self.sources:
+            start = perf_counter()
+            self.sources[name] = pg.image.load(f"{self.data_dir}/{name}.png").convert_alpha()
+            self.decode_ms += (perf_counter() - start) * 1000
+            self.source_sizes[(name, self.source_hash(name))] = self.sources[name].get_size()
+            self.decoded += 1
+            self.dirty = True
+        return self.sources[name]
+
+    def source_size(self, name: str) -> tuple[int, int]:
+        size = self.source_sizes.get((name, self.source_hash(name)))
+        if size is None:
+            size = self.source(name).get_size()
+        return size
+
+    def get(self, name: str, size: tuple[int, int] | None = None, angle: int = 0) -> Surface:
+        """Shared surface, don't mutate it - copy() first if needed."""
+        key = (name, self.source_hash(name), size, angle)
+        surface = self.variants.get(key)
+        if surface is not None:
+            return surface
+
+        start = perf_counter()
+        entry = self.cached.pop(key, None)
+        data = self.read_cached(entry) if entry else None
+        if data is not None:
+            surface = pg.image.frombytes(data, entry[0], "RGBA").convert_alpha()
+            self.cache_ms += (perf_counter() - start) * 1000
+            self.from_cache += 1
+        else:
+            surface = self.source(name)
+            start = perf_counter()
+            if size is not None and size != surface.get_size():
+                surface = pg.transform.scale(surface, size)
+            if angle:
+                surface = pg.transform.rotate(surface, angle)
+            self.scale_ms += (perf_counter() - start) * 1000
+            self.baked += 1
+            self.dirty = True
+        self.variants[key] = surface
+        return surface
+
+    def bake(self, name: str, size: tuple[int, int] | None = None, angle: int = 0):
+        """Make sure a variant exists, without converting it if it's already in the cache file."""
+        key = (name, self.source_hash(name), size, angle)
+        if key not in self.variants and key not in self.cached:
+            self.get(name, size, angle)
+
+    def read_cached(self, entry: tuple) -> bytes | None:
+        """A variant's RGBA, None if the cache file was replaced or cut short since its index was read."""
+        _, offset, length = entry
+        try:
+            with open(self.cache_path, "rb") as f:
+                if os.fstat(f.fileno()).st_mtime_ns != self.cache_mtime:
+                    return None
+                f.seek(self.data_start + offset)
+                data = f.read(length)
+        except OSError:
+            return None
+        return data if len(data) == length else None
+
+    def load(self):
+        """Read just the index, the pixels stay in the file until they're needed.
+
+        A cache that can't be read (cut short, from an older version, not a cache at all) is ignored, and rebuilt on save."""
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return
+
+        def is_current(name, source_hash):
+            try:
+                return self.source_hash(name) == source_hash
+            except FileNotFoundError:
+                return False
+
+        try:
+            with open(self.cache_path, "rb") as f:
+                cache = pickle.load(f)
+                data_start = f.tell()
+                mtime = os.fstat(f.fileno()).st_mtime_ns
+            if cache["version"] != ATLAS_CACHE_VERSION:
+                return
+            source_sizes = {key: tuple(size) for key, size in cache["source_sizes"].items() if is_current(*key)}
+            cached = {key: (tuple(size), int(offset), int(length)) for key, (size, offset, length) in cache["variants"].items() if is_current(*key[:2])}
+        except Exception:
+            self.dirty = True
+            return
+        self.source_sizes, self.cached = source_sizes, cached
+        self.data_start, self.cache_mtime = data_start, mtime
+
+    def save(self):
+        """Write the cache file if anything new was decoded or baked."""
+        if not self.cache_path or not self.dirty:
+            return
+        variants = {key: (entry[0], data) for key, entry in self.cached.items() if (data := self.read_cached(entry)) is not None}
+        for key, surface in self.variants.items():
+            variants[key] = (surface.get_size(), pg.image.tobytes(surface, "RGBA"))
+        offsets = {}
+        offset = 0
+        for key, (size, data) in variants.items():
+            offsets[key] = (size, offset, len(data))
+            offset += len(data)
+        os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+        with open(self.cache_path + ".tmp", "wb") as f:
+            pickle.dump({"version": ATLAS_CACHE_VERSION, "source_sizes": self.source_sizes, "variants": offsets}, f, protocol=pickle.HIGHEST_PROTOCOL)
+            data_start = f.tell()
+            for _, data in variants.values():
+                f.write(data)
+        os.replace(self.cache_path + ".tmp", self.cache_path)
+
+        # Whatever wasn't used yet now lives in the new file
+        self.data_start, self.cache_mtime = data_start, os.stat(self.cache_path).st_mtime_ns
+        self.cached = {key: offsets[key] for key in self.cached if key in offsets}
+        self.dirty = False
+
+    def stats(self) -> str:
+        return f"AssetAtlas: {self.decoded} decoded, {self.baked} baked, {self.from_cache} from cache, {len(self.variants)} variants"
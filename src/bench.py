@@ -0,0 +1,71 @@
+"""Headless frame-time benchmark. Runs smup.py in a few entity-count scenarios and reports per-phase timings.
+
+python src/bench.py --frames 2000 --json bench.json
+python src/bench.py --renderer surface --renderer texture
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from typing import Sequence
+
+ROOT = Path(__file__).resolve().parent.parent
+
+SCENARIOS = {
+    "default": ["--aliens", "10,4,3,1"],
+    "no_aliens": ["--aliens", "0,0,0,0"],
+    "wave_x3": ["--aliens", "30,12,9,3"],
+    "wave_x10": ["--aliens", "100,40,30,10"],
+    "bullet_hell": ["--aliens", "10,4,3,8"],
+    "bullet_storm": ["--aliens", "10,4,3,8", "--fire-rate", "8"],
+    "dense_stars": ["--stars", "8"],
+}
+
+
+def run_smup(smup_args: list[str], frames: int, seed: int) -> dict:
+    """Run smup.py headless with these arguments and return its report."""
+    with tempfile.NamedTemporaryFile(suffix=".json") as report_file:
+        command = [sys.executable, "src/smup.py", "--headless", "--frames", str(frames), "--seed", str(seed), "--report", report_file.name, *smup_args]
+        subprocess.run(command, cwd=ROOT, check=True, stdout=subprocess.DEVNULL)
+        with open(report_file.name) as f:
+            return json.load(f)
+
+
+def run_scenario(name: str, frames: int, seed: int, extra_args: Sequence[str] = ()) -> dict:
+    return run_smup([*SCENARIOS[name], *extra_args], frames, seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--frames", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS, help="run only these scenarios (repeatable)")
+    parser.add_argument("--renderer", action="append", help="passed on to smup.py, repeat to compare renderers (default: surface)")
+    parser.add_argument("--resolution", default="1920x1080", help="passed on to smup.py")
+    parser.add_argument("--sim", default="serial", help="passed on to smup.py")
+    parser.add_argument("--json", help="also write all reports to this file")
+    args = parser.parse_args()
+
+    renderers = args.renderer or ["surface"]
+    reports = {}
+    phases = None
+    for name in args.scenario or SCENARIOS:
+        for renderer in renderers:
+            label = name if len(renderers) == 1 else f"{name}/{renderer}"
+            report = reports[label] = run_scenario(name, args.frames, args.seed, ["--renderer", renderer, "--resolution", args.resolution, "--sim", args.sim])
+            if phases is None:
+                phases = list(report["phase_ms"])
+                print(f"{'scenario':<20} {'p50 ms':>8} {'p99 ms':>8}  " + " ".join(f"{phase:>{max(len(phase), 8)}}" for phase in phases))
+            phase_means = " ".join(f"{report['phase_ms'].get(phase, {}).get('mean', 0):>{max(len(phase), 8)}.3f}" for phase in phases)
+            print(f"{label:<20} {report['frame_ms']['p50']:>8.3f} {report['frame_ms']['p99']:>8.3f}  {phase_means}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(reports, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
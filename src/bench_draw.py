@@ -0,0 +1,100 @@
+"""Draw submission microbenchmark: bullets blitted one by one like the old loop, in one blits call, and through RenderQueue, to surfaces and to SDL textures.
+
+python src/bench_draw.py
+SDL_RENDER_DRIVER=software python src/bench_draw.py
+"""
+
+import random
+import timeit
+
+import numpy as np
+import pygame as pg
+from pygame._sdl2.video import Renderer, Window
+
+from render import RenderQueue, SurfaceRenderer, TextureRenderer
+from sprite_cache import TransformCache
+from utils import FloatRect
+
+SIZES = [100, 1000, 5000]
+IMAGE_SIZES = [(17, 6), (20, 20), (40, 40), (30, 30)]  # Like the game's bullets
+
+
+def make_images() -> list[pg.Surface]:
+    images = []
+    for i, size in enumerate(IMAGE_SIZES):
+        image = pg.Surface(size, pg.SRCALPHA)
+        pg.draw.ellipse(image, (60 * i, 200, 255 - 60 * i, 255), image.get_rect())
+        images.append(image)
+    return images
+
+
+def per_entity(screen, transform_cache, images, x, y, angle, alpha):
+    """The old loop: a Rect per sprite, set_alpha on the image for faded ones, one blit call each.
+
+    The images are shared with the other draw paths, so their alpha is put back afterwards."""
+    original_alpha = {}
+    for image, sprite_x, sprite_y, sprite_angle, sprite_alpha in zip(images, x.tolist(), y.tolist(), angle.tolist(), alpha.tolist()):
+        if sprite_angle:
+            image = transform_cache.rotate(image, sprite_angle, sprite_class="bullet")
+        if image not in original_alpha:
+            original_alpha[image] = image.get_alpha()
+        if np.isnan(sprite_alpha):
+            image.set_alpha(255)
+        else:
+            image.set_alpha(sprite_alpha)
+        screen.blit(image, FloatRect(sprite_x, sprite_y, *image.get_size()).to_rect())
+    for image, image_alpha in original_alpha.items():
+        image.set_alpha(image_alpha)
+
+
+def batched(renderer, transform_cache, images, x, y, angle, alpha):
+    """One blits call, but each sprite's position and transform looked at in Python."""
+    blits = []
+    for image, sprite_x, sprite_y, sprite_angle, sprite_alpha in zip(images, x.tolist(), y.tolist(), angle.tolist(), alpha.tolist()):
+        if sprite_angle or not np.isnan(sprite_alpha):
+            image = transform_cache.rotate(image, sprite_angle, None if np.isnan(sprite_alpha) else sprite_alpha, "bullet")
+        blits.append((image, (round(sprite_x), round(sprite_y))))
+    renderer.blits(blits)
+
+
+def queued(renderer, render_queue, images, x, y, angle, alpha):
+    render_queue.extend("bullets", images, x, y, angle, alpha, sprite_class="bullet")
+    render_queue.submit(renderer)
+
+
+def textured(renderer, render_queue, images, x, y, angle, alpha):
+    """RenderQueue to the texture renderer, including present since SDL holds on to draws until then."""
+    render_queue.extend("bullets", images, x, y, angle, alpha, sprite_class="bullet")
+    render_queue.submit(renderer)
+    renderer.present()
+
+
+def bench(name: str, statement, count: int, number: int = 20):
+    seconds = min(timeit.repeat(statement, number=number, repeat=5)) / number
+    print(f"{name:<32} {count:>6} sprites {seconds * 1000:8.3f} ms {seconds / count * 1e9:8.0f} ns per sprite")
+
+
+def main():
+    pg.display.set_mode((1, 1), pg.HIDDEN)  # For the texture renderer's window and convert_alpha
+    screen = pg.Surface((1920, 1080))
+    renderer = SurfaceRenderer(screen, pg.Surface((1, 1)))
+    transform_cache = TransformCache(angle_steps={"bullet": 4})
+    render_queue = RenderQueue(transform_cache)
+    texture_renderer = TextureRenderer(pg.Surface((1920, 1080), pg.SRCALPHA), pg.Surface((1, 1)), Renderer(Window("bench_draw", (1920, 1080), hidden=True)))
+    texture_queue = RenderQueue(transform_cache, native=True)
+    sources = [image.convert_alpha() for image in make_images()]
+    rng = np.random.default_rng(0)
+    for count in SIZES:
+        images = [random.choice(sources) for _ in range(count)]
+        x = rng.uniform(0, 1900, count)
+        y = rng.uniform(0, 1060, count)
+        angle = np.where(rng.random(count) < 0.3, rng.uniform(0, 360, count), 0)  # Alien bullets spin
+        alpha = np.where(rng.random(count) < 0.1, 127, np.nan)  # Dying ones are faded for a frame
+        bench("per entity blit", lambda: per_entity(screen, transform_cache, images, x, y, angle, alpha), count)
+        bench("one blits, sprite by sprite", lambda: batched(renderer, transform_cache, images, x, y, angle, alpha), count)
+        bench("RenderQueue", lambda: queued(renderer, render_queue, images, x, y, angle, alpha), count)
+        bench("RenderQueue, textures", lambda: textured(texture_renderer, texture_queue, images, x, y, angle, alpha), count)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""FloatRect microbenchmark, against the old dict-based FloatRect and pygame's FRect (pygame-ce only).
+
+python src/bench_rect.py
+"""
+
+import random
+import timeit
+
+import numpy as np
+import pygame as pg
+
+from utils import FloatRect
+
+
+class LegacyFloatRect:
+    """FloatRect as it was before __slots__ and the in-place methods, for comparison."""
+
+    def __init__(self, x, y, width, height):
+        self.x = float(x)
+        self.y = float(y)
+        self.width = float(width)
+        self.height = float(height)
+
+    @property
+    def left(self):
+        return self.x
+
+    @property
+    def right(self):
+        return self.x + self.width
+
+    @property
+    def top(self):
+        return self.y
+
+    @property
+    def bottom(self):
+        return self.y + self.height
+
+    def inflate(self, x, y):
+        return LegacyFloatRect(self.x - x / 2, self.y - y / 2, self.width + x, self.height + y)
+
+    def move(self, x, y):
+        return LegacyFloatRect(self.x + x, self.y + y, self.width, self.height)
+
+    def colliderect(self, other):
+        return not (self.right <= other.left or self.left >= other.right or self.bottom <= other.top or self.top >= other.bottom)
+
+    def copy(self):
+        return LegacyFloatRect(self.x, self.y, self.width, self.height)
+
+
+def bench(name: str, statement, number: int):
+    seconds = min(timeit.repeat(statement, number=number, repeat=5))
+    print(f"{name:<48} {seconds / number * 1e9:10.1f} ns")
+
+
+def main():
+    number = 100_000
+    rects = {"legacy": LegacyFloatRect, "FloatRect": FloatRect}
+    if hasattr(pg, "FRect"):
+        rects["pygame.FRect"] = pg.FRect
+    else:
+        print("pygame.FRect not available (needs pygame-ce), skipping it")
+
+    for name, cls in rects.items():
+        a = cls(10, 10, 100, 80)
+        b = cls(50, 40, 100, 80)
+        bench(f"{name}: construct", lambda: cls(10, 10, 100, 80), number)
+        bench(f"{name}: colliderect", lambda: a.colliderect(b), number)
+        bench(f"{name}: colliderect(inflate())", lambda: a.colliderect(b.inflate(20, 20)), number)
+        bench(f"{name}: move", lambda: a.move(0.5, 0.5), number)
+        if hasattr(a, "move_ip"):
+            bench(f"{name}: move_ip", lambda: a.move_ip(0.5, -0.5), number)
+        if hasattr(a, "inflate_ip"):
+            bench(f"{name}: inflate_ip", lambda: (a.inflate_ip(2, 2), a.inflate_ip(-2, -2)), number)
+
+    # One against many
+    many = [FloatRect(random.random() * 1920, random.random() * 1080, 100, 100) for _ in range(1000)]
+    boxes = np.array([(rect.x, rect.y, rect.width, rect.height) for rect in many])
+    probe = FloatRect(900, 500, 120, 120)
+    bench("FloatRect: colliderect loop, 1000 rects", lambda: [rect for rect in many if probe.colliderect(rect)], 1000)
+    bench("FloatRect: collidelistall, 1000 rects", lambda: probe.collidelistall(many), 1000)
+    bench("FloatRect: collidearray, 1000 rects", lambda: probe.collidearray(boxes), 1000)
+    if hasattr(pg, "FRect"):
+        frects = [pg.FRect(rect.x, rect.y, rect.width, rect.height) for rect in many]
+        frect_probe = pg.FRect(900, 500, 120, 120)
+        bench("pygame.FRect: collidelistall, 1000 rects", lambda: frect_probe.collidelistall(frects), 1000)
+
+
+if __name__ == "__main__":
+    main()
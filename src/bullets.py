@@ -0,0 +1,168 @@
+from dataclasses import dataclass
+from math import ceil
+from time import perf_counter
+
+import numpy as np
+from pygame import Surface
+from pygame.mask import Mask
+
+from spatial import GridIndex
+from utils import FloatRect
+
+TARGET_TYPES = ["Alien", "Player"]
+BULLET_SIZE = 10
+BULLET_MASK = Mask((BULLET_SIZE, BULLET_SIZE), fill=True)
+POOL_FIELDS = ("x", "y", "previous_x", "previous_y", "dx", "dy", "speed", "target", "image", "active", "dying")
+
+
+def slab(start: np.ndarray, end: np.ndarray, low: np.ndarray, high: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Fractions of the way from start to end where a point enters and leaves the open interval (low, high)."""
+    delta = end - start
+    with np.errstate(divide="ignore", invalid="ignore"):
+        to_low = (low - start) / delta
+        to_high = (high - start) / delta
+    still = delta == 0
+    inside = (low < start) & (start < high)
+    enter = np.where(still, np.where(inside, -np.inf, np.inf), np.minimum(to_low, to_high))
+    leave = np.where(still, np.where(inside, np.inf, -np.inf), np.maximum(to_low, to_high))
+    return enter, leave
+
+
+def swept_overlap(x0, y0, x1, y1, left, top, width, height) -> np.ndarray:
+    """Whether a bullet moving from (x0, y0) to (x1, y1) touched the rect anywhere on the way, broadcast like numpy.
+
+    The rect is grown by the bullet size, so the bullet is a point and the test is a segment against two slabs."""
+    enter_x, leave_x = slab(x0, x1, left - BULLET_SIZE, left + width)
+    enter_y, leave_y = slab(y0, y1, top - BULLET_SIZE, top + height)
+    return np.maximum(np.maximum(enter_x, enter_y), 0) < np.minimum(np.minimum(leave_x, leave_y), 1)
+
+
+@dataclass
+class BulletPool:
+    """Preallocated structure-of-arrays bullet storage, with free-slot reuse instead of list rebuilds."""
+
+    images: list[Surface]
+    capacity: int = 256
+    cull_margin: float = 100  # How far outside the playfield a bullet can get before it's dropped
+
+    # Counters
+    live: int = 0
+    culled: int = 0
+    peak: int = 0
+    narrow_tests: int = 0  # Rect hits checked against a mask
+    narrow_rejected: int = 0  # ...that turned out to only touch transparent pixels
+    narrow_ms: float = 0.0
+
+    def __post_init__(self):
+        self.image_ids = {image: i for i, image in enumerate(self.images)}
+        self.x = np.zeros(self.capacity)
+        self.y = np.zeros(self.capacity)
+        self.previous_x = np.zeros(self.capacity)  # Where move() started from, in this frame's coordinates, for swept collisions
+        self.previous_y = np.zeros(self.capacity)
+        self.dx = np.zeros(self.capacity)
+        self.dy = np.zeros(self.capacity)
+        self.speed = np.zeros(self.capacity)
+        self.target = np.zeros(self.capacity, dtype=np.int8)
+        self.image = np.zeros(self.capacity, dtype=np.int16)
+        self.active = np.zeros(self.capacity, dtype=bool)
+        self.dying = np.zeros(self.capacity, dtype=bool)  # Deactivated this frame, drawn once more faded
+        self.free = list(range(self.capacity - 1, -1, -1))
+
+    def grow(self):
+        old_capacity = self.capacity
+        self.capacity *= 2
+        for name in POOL_FIELDS:
+            array = getattr(self, name)
+            setattr(self, name, np.concatenate([array, np.zeros_like(array)]))
+        self.free.extend(range(self.capacity - 1, old_capacity - 1, -1))
+
+    def spawn(self, image: Surface, x: float, y: float, speed: float, direction: tuple[float, float], target_type: str) -> int:
+        if not self.free:
+            self.grow()
+        i = self.free.pop()
+        self.x[i] = self.previous_x[i] = x
+        self.y[i] = self.previous_y[i] = y
+        self.dx[i], self.dy[i] = direction
+        self.speed[i] = speed
+        self.target[i] = TARGET_TYPES.index(target_type)
+        self.image[i] = self.image_ids[image]
+        self.active[i] = True
+        self.dying[i] = False
+        self.live += 1
+        self.peak = max(self.peak, self.live)
+        return i
+
+    def move(self, dt: float, shift_x: float, shift_y: float):
+        # Inactive slots drift too, it's cheaper than masking and spawn() overwrites them anyway
+        # The shift moves everything, so it's applied to the start too and only the bullet's own motion is swept
+        np.subtract(self.x, shift_x, out=self.previous_x)
+        np.add(self.y, shift_y, out=self.previous_y)
+        self.x += self.speed * self.dx * dt - shift_x
+        self.y += self.speed * self.dy * dt + shift_y
+
+    def cull(self, width: float, height: float):
+        """Drop active bullets whose center left the (0, 0, width, height) playfield by more than cull_margin."""
+        margin = self.cull_margin
+        centerx = self.x + BULLET_SIZE / 2
+        centery = self.y + BULLET_SIZE / 2
+        offscreen = (centerx < -margin) | (centerx > width + margin) | (centery < -margin) | (centery > height + margin)
+        culled = np.flatnonzero(self.active & offscreen)
+        if culled.size:
+            self.release(culled)
+            self.live -= culled.size
+            self.culled += culled.size
+
+    def collide(self, rect: FloatRect, target_type: str) -> np.ndarray:
+        """Indices of active bullets aimed at target_type that touched rect during the last move."""
+        indices = np.flatnonzero(self.active & (self.target == TARGET_TYPES.index(target_type)))
+        hits = swept_overlap(self.previous_x[indices], self.previous_y[indices], self.x[indices], self.y[indices], rect.x, rect.y, rect.width, rect.height)
+        return indices[hits]
+
+    def collide_many(self, grid: GridIndex, left: np.ndarray, top: np.ndarray, width: np.ndarray, height: np.ndarray, target_type: str) -> tuple[np.ndarray, np.ndarray]:
+        """Test all matching bullets against many rects, given as arrays. The grid picks candidate pairs from the box each bullet swept, only those get the swept test.
+
+        Returns (bullet index, rect index) pairs that touched during the last move."""
+        indices = np.flatnonzero(self.active & (self.target == TARGET_TYPES.index(target_type)))
+        x0, y0, x1, y1 = self.previous_x[indices], self.previous_y[indices], self.x[indices], self.y[indices]
+        i, j = grid.cross_pairs(np.minimum(x0, x1), np.minimum(y0, y1), np.abs(x1 - x0) + BULLET_SIZE, np.abs(y1 - y0) + BULLET_SIZE, left, top, width, height)
+        hits = swept_overlap(x0[i], y0[i], x1[i], y1[i], left[j], top[j], width[j], height[j])
+        return indices[i[hits]], j[hits]
+
+    def refine(self, indices: np.ndarray, mask: Mask, left: float, top: float) -> np.ndarray:
+        """Narrowphase for bullets that already passed the rect test: the ones that touched a set pixel of mask, placed at (left, top), during the last move.
+
+        The move is sampled every half bullet, so the pixel test keeps up with the swept rect test."""
+        start = perf_counter()
+        hits = []
+        for i, x0, y0, x1, y1 in zip(indices.tolist(), self.previous_x[indices].tolist(), self.previous_y[indices].tolist(), self.x[indices].tolist(), self.y[indices].tolist()):
+            samples = max(ceil(max(abs(x1 - x0), abs(y1 - y0)) / (BULLET_SIZE / 2)), 1)
+            for k in range(samples, -1, -1):  # From the end, where most hits are
+                if mask.overlap(BULLET_MASK, (round(x0 + (x1 - x0) * k / samples - left), round(y0 + (y1 - y0) * k / samples - top))):
+                    hits.append(i)
+                    break
+        self.narrow_tests += len(indices)
+        self.narrow_rejected += len(indices) - len(hits)
+        self.narrow_ms += (perf_counter() - start) * 1000
+        return np.array(hits, dtype=np.intp)
+
+    def kill(self, indices: np.ndarray):
+        self.active[indices] = False
+        self.dying[indices] = True
+        self.live -= len(indices)
+
+    def release(self, indices: np.ndarray):
+        self.active[indices] = False
+        self.dying[indices] = False
+        self.free.extend(indices.tolist())
+
+    def release_dying(self):
+        self.release(np.flatnonzero(self.dying))
+
+    def visible(self) -> np.ndarray:
+        return np.flatnonzero(self.active | self.dying)
+
+    def nbytes(self) -> int:
+        return sum(getattr(self, name).nbytes for name in POOL_FIELDS) + len(self.free) * 8
+
+    def stats(self) -> str:
+        return f"Bullets: {self.live} live, {self.culled} culled, {self.peak} peak, {self.capacity} capacity, masks rejected {self.narrow_rejected}/{self.narrow_tests} rect hits in {self.narrow_ms:.1f} ms"
@@ -0,0 +1,113 @@
+from dataclasses import dataclass
+from math import ceil
+
+import numpy as np
+from pygame import Surface
+
+from assets import AssetAtlas
+
+# As the explosions always faded: from the alien's 220 alpha, 15 less every dt (1/36 s), so gone after ~0.41 s
+START_ALPHA = 220
+FADE_PER_SECOND = 15 * 36
+FRAME_TIME = 1 / 32  # Game seconds per frame
+FRAME_COUNT = ceil(START_ALPHA / FADE_PER_SECOND / FRAME_TIME)
+FRAME_SCALE = np.linspace(0.85, 1.3, FRAME_COUNT)  # Grows while it fades
+FADE = np.maximum(START_ALPHA - FADE_PER_SECOND * FRAME_TIME * np.arange(FRAME_COUNT), 0).round().astype(int)  # Alpha per frame, shared by every size
+POOL_FIELDS = ["x", "y", "dx", "dy", "start", "animation", "active"]
+
+
+@dataclass
+class Explosions:
+    """Pooled explosion animations. Each size's frames are scaled and faded through FADE once up front,
+    so an explosion only takes a pool slot and points at shared frames, and they're all drawn in one blits call."""
+
+    atlas: AssetAtlas
+    name: str = "explosion"
+    capacity: int = 64
+    size_step: int = 10  # Sizes are rounded to this, so similar beings share frames
+
+    # Stats
+    live: int = 0
+    peak: int = 0
+    spawned: int = 0
+    late_bakes: int = 0  # Sizes nobody baked up front, scaled mid game
+
+    def __post_init__(self):
+        self.animations: list[list[Surface]] = []
+        self.animation_index: dict[tuple[int, int], int] = {}
+        self.sizes: list[tuple[int, int]] = []  # Of each animation, what clients bake theirs by
+        self.x = np.zeros(self.capacity)
+        self.y = np.zeros(self.capacity)
+        self.dx = np.zeros(self.capacity)
+        self.dy = np.zeros(self.capacity)
+        self.start = np.zeros(self.capacity)
+        self.animation = np.zeros(self.capacity, dtype=np.int32)
+        self.active = np.zeros(self.capacity, dtype=bool)
+        self.free = list(range(self.capacity - 1, -1, -1))
+
+    def bucket(self, size: tuple[int, int]) -> tuple[int, int]:
+        return (max(round(size[0] / self.size_step), 1) * self.size_step, max(round(size[1] / self.size_step), 1) * self.size_step)
+
+    def bake(self, size: tuple[int, int]) -> int:
+        """Frames for explosions of this size, made once, the scaled ones also end up in the atlas cache."""
+        size = self.bucket(size)
+        if size not in self.animation_index:
+            frames = []
+            for scale, alpha in zip(FRAME_SCALE, FADE.tolist()):
+                frame = self.atlas.get(self.name, (round(size[0] * scale), round(size[1] * scale))).copy()
+                frame.set_alpha(alpha)
+                frames.append(frame)
+            self.animation_index[size] = len(self.animations)
+            self.animations.append(frames)
+            self.sizes.append(size)
+        return self.animation_index[size]
+
+    def grow(self):
+        old_capacity = self.capacity
+        self.capacity *= 2
+        for name in POOL_FIELDS:
+            array = getattr(self, name)
+            setattr(self, name, np.concatenate([array, np.zeros_like(array)]))
+        self.free.extend(range(self.capacity - 1, old_capacity - 1, -1))
+
+    def spawn(self, size: tuple[int, int], center_x: float, center_y: float, now: float, dx: float = 0, dy: float = 0):
+        if self.bucket(size) not in self.animation_index:
+            self.late_bakes += 1
+        animation = self.bake(size)
+        if not self.free:
+            self.grow()
+        i = self.free.pop()
+        self.x[i] = center_x
+        self.y[i] = center_y
+        self.dx[i] = dx
+        self.dy[i] = dy
+        self.start[i] = now
+        self.animation[i] = animation
+        self.active[i] = True
+        self.live += 1
+        self.spawned += 1
+        self.peak = max(self.peak, self.live)
+
+    def update(self, dt: float, shift_x: float, shift_y: float, now: float):
+        active = self.active
+        self.x[active] += self.dx[active] * dt - shift_x
+        self.y[active] += self.dy[active] * dt + shift_y
+        finished = np.flatnonzero(active & (self.frames(now) >= FRAME_COUNT))
+        if finished.size:
+            self.active[finished] = False
+            self.free.extend(finished.tolist())
+            self.live -= finished.size
+
+    def frames(self, now: float) -> np.ndarray:
+        return ((now - self.start) / FRAME_TIME).astype(int)
+
+    def sprites(self, now: float) -> tuple[np.ndarray, list[Surface], np.ndarray, np.ndarray]:
+        """Slots, current frame and top left of every playing explosion."""
+        playing = np.flatnonzero(self.active)
+        images = [self.animations[animation][frame] for animation, frame in zip(self.animation[playing].tolist(), np.minimum(self.frames(now)[playing], FRAME_COUNT - 1).tolist())]
+        half_width = np.array([image.get_width() / 2 for image in images])
+        half_height = np.array([image.get_height() / 2 for image in images])
+        return playing, images, self.x[playing] - half_width, self.y[playing] - half_height
+
+    def stats(self) -> str:
+        return f"Explosions: {self.live} live, {self.peak} peak, {self.capacity} capacity, {self.spawned} spawned, {len(self.animations)} sizes, {self.late_bakes} baked late"
@@ -0,0 +1,62 @@
+from dataclasses import dataclass
+
+
+@dataclass
+class GameClock:
+    """Simulated time in seconds. It advances with the scaled dt, not the wall clock, so it's cheap and reproducible."""
+
+    seconds_per_dt: float
+    now: float = 0.0
+
+    def tick(self, dt: float):
+        self.now += dt * self.seconds_per_dt
+
+
+@dataclass
+class Cooldown:
+    period: float
+    last: float = float("-inf")
+
+    def ready(self, now: float) -> bool:
+        return now > self.last + self.period
+
+    def trigger(self, now: float):
+        self.last = now
+
+    def within(self, now: float, periods: float = 1) -> bool:
+        """Triggered in the last `periods` periods."""
+        return now - self.period * periods < self.last
+
+
+@dataclass
+class FixedStep:
+    """Turns wall clock time into a whole number of fixed simulation steps, keeping the remainder for the next frame.
+
+    At most max_steps run per frame, the rest is dropped so a long stall slows the game down instead of spiraling."""
+
+    step_ms: float
+    max_steps: int = 5
+    accumulated: float = 0.0
+
+    # Stats
+    steps: int = 0
+    dropped_ms: float = 0.0
+
+    def advance(self, elapsed_ms: float) -> int:
+        self.accumulated += elapsed_ms
+        steps = int(self.accumulated // self.step_ms)
+        if steps > self.max_steps:
+            self.dropped_ms += (steps - self.max_steps) * self.step_ms
+            self.accumulated -= (steps - self.max_steps) * self.step_ms
+            steps = self.max_steps
+        self.accumulated -= steps * self.step_ms
+        self.steps += steps
+        return steps
+
+    @property
+    def alpha(self) -> float:
+        """How far into the next step the wall clock is, for blending the last two steps."""
+        return self.accumulated / self.step_ms
+
+    def stats(self) -> str:
+        return f"FixedStep: {self.steps} steps of {self.step_ms:.2f} ms, {self.dropped_ms:.0f} ms dropped"
@@ -0,0 +1,108 @@
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+import pygame as pg
+
+
+@dataclass
+class InputState:
+    """Action state table fed by input events, instead of polling every device for every action each frame.
+
+    Each action tracks which inputs currently hold it, so a key and a pad pressing the same action don't cancel out,
+    and presses shorter than a frame are still reported once."""
+
+    bindings: dict[str, dict]
+    axis_threshold: float = 0.5
+    joysticks: dict[int, pg.joystick.JoystickType] = field(default_factory=dict)
+
+    def __post_init__(self):
+        # Reverse lookups, from device inputs to actions
+        self.key_actions = defaultdict(list)
+        self.mouse_actions = defaultdict(list)
+        self.button_actions = defaultdict(list)
+        self.axis_actions = defaultdict(list)
+        self.hat_actions = defaultdict(list)
+        for action, control in self.bindings.items():
+            for key in control.get("keyboard", []):
+                self.key_actions[key].append(action)
+            if "mouse_button" in control:
+                self.mouse_actions[control["mouse_button"] + 1].append(action)  # Event buttons start at 1
+            if "joystick_button" in control:
+                self.button_actions[control["joystick_button"]].append(action)
+            if "joystick_axis" in control:
+                axis, direction = control["joystick_axis"]
+                self.axis_actions[axis].append((direction, action))
+            if "joystick_hat" in control:
+                axis, direction = control["joystick_hat"]
+                self.hat_actions[axis].append((direction, action))
+
+        self.held = defaultdict(set)  # Action -> inputs holding it
+        self.pressed = set()  # Actions pressed since the last poll, even if already released
+
+    def press(self, action: str, source: tuple):
+        self.held[action].add(source)
+        self.pressed.add(action)
+
+    def release(self, action: str, source: tuple):
+        self.held[action].discard(source)
+
+    def release_all(self, matches):
+        for sources in self.held.values():
+            for source in [source for source in sources if matches(source)]:
+                sources.discard(source)
+
+    def handle(self, event: pg.event.Event):
+        match event.type:
+            case pg.QUIT | pg.WINDOWCLOSE:  # The texture renderer's window closing doesn't quit on its own, the hidden display is still open
+                self.pressed.add("quit")
+            case pg.KEYDOWN:
+                for action in self.key_actions.get(event.key, ()):
+                    self.press(action, ("key", event.key))
+            case pg.KEYUP:
+                for action in self.key_actions.get(event.key, ()):
+                    self.release(action, ("key", event.key))
+            case pg.MOUSEBUTTONDOWN:
+                for action in self.mouse_actions.get(event.button, ()):
+                    self.press(action, ("mouse", event.button))
+            case pg.MOUSEBUTTONUP:
+                for action in self.mouse_actions.get(event.button, ()):
+                    self.release(action, ("mouse", event.button))
+            case pg.JOYBUTTONDOWN:
+                for action in self.button_actions.get(event.button, ()):
+                    self.press(action, ("joystick_button", event.instance_id, event.button))
+            case pg.JOYBUTTONUP:
+                for action in self.button_actions.get(event.button, ()):
+                    self.release(action, ("joystick_button", event.instance_id, event.button))
+            case pg.JOYAXISMOTION:
+                for direction, action in self.axis_actions.get(event.axis, ()):
+                    source = ("joystick_axis", event.instance_id, event.axis, direction)
+                    if event.value * direction > self.axis_threshold:
+                        self.press(action, source)
+                    else:
+                        self.release(action, source)
+            case pg.JOYHATMOTION if event.hat == 0:
+                for axis, bindings in self.hat_actions.items():
+                    for direction, action in bindings:
+                        source = ("joystick_hat", event.instance_id, axis, direction)
+                        if event.value[axis] == direction:
+                            self.press(action, source)
+                        else:
+                            self.release(action, source)
+            case pg.JOYDEVICEADDED:
+                joystick = pg.joystick.Joystick(event.device_index)
+                self.joysticks[joystick.get_instance_id()] = joystick
+            case pg.JOYDEVICEREMOVED:
+                self.joysticks.pop(event.instance_id, None)
+                self.release_all(lambda source: source[0].startswith("joystick") and source[1] == event.instance_id)
+            case pg.WINDOWFOCUSLOST:
+                # Key and mouse ups go to whoever has focus now, don't leave them stuck
+                self.release_all(lambda source: source[0] in ("key", "mouse"))
+
+    def poll(self) -> dict[str, bool]:
+        """Process pending events, and return the actions held now or pressed since the last poll."""
+        for event in pg.event.get():
+            self.handle(event)
+        controls = {action: True for action, sources in self.held.items() if sources}
+        controls.update((action, True) for action in self.pressed)
+        self.pressed.clear()
+        return controls
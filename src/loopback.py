@@ -0,0 +1,73 @@
+"""Co-op test over localhost: a headless server and a headless client, with latency, jitter and packet loss on what both send. Reports bytes per tick, lost states and prediction error.
+
+python src/loopback.py --frames 1800 --latency-ms 50 --jitter-ms 10 --loss 0.05
+python src/loopback.py --max-bytes-per-tick 1200 -- --aliens 100,40,30,10
+"""
+
+import argparse
+import json
+import socket
+import subprocess
+import sys
+import tempfile
+
+from bench import ROOT
+
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--frames", type=int, default=1800, help="server steps, at the step rate in real time")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tick-rate", type=float, default=30)
+    parser.add_argument("--latency-ms", type=float, default=50, help="each way")
+    parser.add_argument("--jitter-ms", type=float, default=10)
+    parser.add_argument("--loss", type=float, default=0.05, help="fraction of packets dropped each way")
+    parser.add_argument("--max-bytes-per-tick", type=float, help="limit for the p99 of what the server sends per tick")
+    parser.add_argument("smup_args", nargs="*", help="passed on to the server's smup.py, after --")
+    args = parser.parse_args()
+
+    address = f"127.0.0.1:{free_port()}"
+    shim = ["--net-latency", str(args.latency_ms), "--net-jitter", str(args.jitter_ms), "--net-loss", str(args.loss)]
+    with tempfile.TemporaryDirectory() as report_dir:
+        server_command = [sys.executable, "src/smup.py", "--headless", "--frames", str(args.frames), "--seed", str(args.seed), "--tick-rate", str(args.tick_rate), "--host", address, "--report", f"{report_dir}/server.json", *shim, *args.smup_args]
+        client_command = [sys.executable, "src/smup.py", "--headless", "--join", address, "--report", f"{report_dir}/client.json", *shim]
+        server = subprocess.Popen(server_command, cwd=ROOT, stdout=subprocess.DEVNULL)
+        client = subprocess.Popen(client_command, cwd=ROOT, stdout=subprocess.DEVNULL)
+        for name, process in [("client", client), ("server", server)]:
+            if process.wait() != 0:
+                sys.exit(f"FAIL: the {name} exited with {process.returncode}")
+        with open(f"{report_dir}/server.json") as f:
+            server_net = json.load(f)["net"]
+        with open(f"{report_dir}/client.json") as f:
+            client_net = json.load(f)["net"]
+
+    sent = server_net["bytes_per_tick"]
+    prediction = client_net["prediction_error_px"]
+    print(f"Server: {server_net['ticks']} ticks at {args.tick_rate:g}/s, {sent['mean']:.0f} bytes per tick (p99 {sent['p99']:.0f}, max {sent['max']}), full states would be {server_net['raw_bytes_per_tick']:.0f}")
+    print(f"        {server_net['full_states']} sent without a baseline, {server_net['coarse_states']} coarser to fit a datagram, {server_net['repeated_inputs']} steps without a new input, {server_net['skipped_inputs']} inputs skipped")
+    print(f"Client: {client_net['received']} states received, {client_net['lost']} lost, {client_net['stale']} stale, {client_net['undecodable']} undecodable, {client_net['input_bytes_per_packet']:.0f} bytes per input packet")
+    print(f"        prediction error {prediction['mean']:.2f} px mean, {prediction['p99']:.2f} p99, {prediction['max']:.2f} max, {client_net['interpolation']['underruns']} interpolation underruns")
+    for name, net in [("server", server_net), ("client", client_net)]:
+        link = net["link"]
+        print(f"Link:   {name} sent {link['sent']} packets, {link['dropped']} dropped, {link['bytes_sent']} bytes")
+
+    failures = []
+    if not client_net["received"]:
+        failures.append("the client got no world states")
+    if args.max_bytes_per_tick is not None and sent["p99"] > args.max_bytes_per_tick:
+        failures.append(f"p99 of {sent['p99']:.0f} bytes per tick is over the {args.max_bytes_per_tick:g} byte limit")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if failures:
+        sys.exit(1)
+    print(f"OK: {sent['mean'] / max(server_net['raw_bytes_per_tick'], 1):.0%} of the full state size per tick")
+
+
+if __name__ == "__main__":
+    main()
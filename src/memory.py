@@ -0,0 +1,93 @@
+import gc
+import sys
+import tracemalloc
+from dataclasses import dataclass, field
+from typing import Callable
+
+try:
+    import resource
+except ImportError:  # Not on Windows
+    resource = None
+
+
+def count_instances(cls: type) -> tuple[int, int]:
+    """Live instances of cls and their shallow size, by walking the GC. Slow, for periodic samples only."""
+    instances = [obj for obj in gc.get_objects() if type(obj) is cls]
+    return len(instances), sum(sys.getsizeof(obj) for obj in instances)
+
+
+def max_rss_bytes() -> int | None:
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024  # Linux reports KB
+
+
+def megabytes(size: int) -> str:
+    return f"{size / 1024 / 1024:.1f} MB"
+
+
+@dataclass
+class MemoryMonitor:
+    """Periodic memory samples, the Python heap from tracemalloc plus live count and bytes of each category.
+
+    Categories cover what tracemalloc can't see, like SDL surface pixels. One that grew on growth_window samples in a row is flagged as a likely leak."""
+
+    categories: dict[str, Callable[[], tuple[int, int]]]
+    growth_window: int = 5
+    top_lines: int = 3  # Biggest allocation sites since the last sample, printed when something is flagged
+    samples: list[dict] = field(default_factory=list)
+
+    def __post_init__(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.last_snapshot = None
+
+    def sample(self, frame: int) -> dict:
+        traced, traced_peak = tracemalloc.get_traced_memory()
+        sample = {
+            "frame": frame,
+            "python": [None, traced],
+            "python_peak": traced_peak,
+            "max_rss": max_rss_bytes(),
+        }
+        for name, measure in self.categories.items():
+            sample[name] = list(measure())
+        self.samples.append(sample)
+
+        snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+        self.top_growth = snapshot.compare_to(self.last_snapshot, "lineno")[: self.top_lines] if self.last_snapshot else []
+        self.last_snapshot = snapshot
+        return sample
+
+    def growing(self) -> list[str]:
+        """Categories whose bytes went up on each of the last growth_window samples."""
+        if len(self.samples) <= self.growth_window:
+            return []
+        window = self.samples[-self.growth_window - 1 :]
+        return [name for name in ["python", *self.categories] if all(later[name][1] > earlier[name][1] for earlier, later in zip(window, window[1:]))]
+
+    def format(self, sample: dict) -> str:
+        parts = [f"python {megabytes(sample['python'][1])} (peak {megabytes(sample['python_peak'])})"]
+        parts += [f"{name} {sample[name][0]} / {megabytes(sample[name][1])}" for name in self.categories]
+        if sample["max_rss"] is not None:
+            parts.append(f"max RSS {megabytes(sample['max_rss'])}")
+        line = f"Memory at frame {sample['frame']}: " + ", ".join(parts)
+        growing = self.growing()
+        if growing:
+            line += f"\nMemory: growing for {self.growth_window} samples in a row: {', '.join(growing)}"
+            line += "".join(f"\n    {stat}" for stat in self.top_growth)
+        return line
+
+    def summary(self) -> dict:
+        """Peaks over the whole run and what was still growing at the end, for reports. Surface pixels aren't in the Python heap, so the two add up."""
+        if not self.samples:
+            return {"samples": 0}
+        peaks = {name: max(sample[name][1] for sample in self.samples) for name in ["python", *self.categories]}
+        return {
+            "samples": len(self.samples),
+            "last": self.samples[-1] if self.samples else None,
+            "peak_bytes": peaks,
+            "peak_total": sum(peaks[name] for name in ["python", "surfaces"] if name in peaks),
+            "growing": self.growing(),
+        }
@@ -0,0 +1,405 @@
+import errno
+import heapq
+import json
+import random
+import socket
+import struct
+import zlib
+from collections import deque
+from dataclasses import dataclass, field
+from time import perf_counter, sleep
+
+import numpy as np
+
+from wire import BASELINE_WINDOW, MAX_DATAGRAM, NO_BASELINE, WorldCodec, WorldState
+
+HELLO, WELCOME, INPUT, SNAPSHOT, BYE = range(5)  # First byte of every packet, BYE goes both ways
+PROTOCOL_VERSION = 1
+SNAPSHOT_HEADER = struct.Struct("<BIII")  # Kind, tick, baseline tick, last input sequence applied for this client
+INPUT_HEADER = struct.Struct("<BIIB")  # Kind, newest tick received, newest input sequence, inputs that follow (oldest first, uint16 bitmasks)
+INPUT_REDUNDANCY = 8  # Inputs resent with every packet, so a lost one is covered by the next ones
+TIMEOUT = 3.0  # Seconds without hearing from the other side before giving up on it
+MALFORMED = (ValueError, KeyError, TypeError, IndexError, struct.error, zlib.error)  # What parsing a cut short or garbage packet raises, json's errors are ValueErrors
+
+
+def parse_address(address: str) -> tuple[str, int]:
+    """HOST:PORT, or just PORT for all interfaces."""
+    host, _, port = address.rpartition(":")
+    return host or "0.0.0.0", int(port)
+
+
+def parse_json(data: bytes) -> dict:
+    """The JSON object after a packet's kind byte, ValueError if it isn't one."""
+    message = json.loads(data[1:])
+    if not isinstance(message, dict):
+        raise ValueError("not a JSON object")
+    return message
+
+
+def pack_controls(controls: dict[str, bool], actions: list[str]) -> int:
+    return sum(1 << i for i, action in enumerate(actions) if action in controls)
+
+
+def unpack_controls(mask: int, actions: list[str]) -> dict[str, bool]:
+    return {action: True for i, action in enumerate(actions) if mask & (1 << i)}
+
+
+@dataclass
+class LossyLink:
+    """A non-blocking UDP socket with simulated latency, jitter and packet loss on what it sends, for testing over localhost.
+
+    Outgoing packets wait in a queue until they're due, jitter can reorder them like a real network would. With everything at 0 packets go straight out."""
+
+    sock: socket.socket
+    latency_ms: float = 0
+    jitter_ms: float = 0
+    loss: float = 0
+    seed: int | None = None
+
+    # Stats
+    sent: int = 0
+    dropped: int = 0
+    bytes_sent: int = 0
+    bytes_received: int = 0
+
+    def __post_init__(self):
+        self.sock.setblocking(False)
+        self.rng = random.Random(self.seed)  # Its own, the game's random has to stay reproducible
+        self.queue = []
+        self.queued = 0
+
+    @classmethod
+    def bind(cls, address: tuple[str, int] = ("0.0.0.0", 0), **shim) -> "LossyLink":
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(address)
+        return cls(sock, **shim)
+
+    def send(self, data: bytes, address: tuple[str, int]):
+        self.sent += 1
+        self.bytes_sent += len(data)
+        if self.loss and self.rng.random() < self.loss:
+            self.dropped += 1
+            return
+        delay = self.latency_ms + self.rng.uniform(-self.jitter_ms, self.jitter_ms)
+        if delay <= 0 and not self.queue:
+            self.transmit(data, address)
+            return
+        heapq.heappush(self.queue, (perf_counter() + delay / 1000, self.queued, data, address))
+        self.queued += 1
+
+    def transmit(self, data: bytes, address: tuple[str, int]):
+        try:
+            self.sock.sendto(data, address)
+        except OSError as error:
+            if error.errno != errno.ECONNREFUSED:  # Nobody listening (yet), UDP doesn't care either
+                raise
+
+    def flush(self, everything: bool = False):
+        """Send the queued packets that are due, or all of them when closing."""
+        now = perf_counter()
+        while self.queue and (everything or self.queue[0][0] <= now):
+            _, _, data, address = heapq.heappop(self.queue)
+            self.transmit(data, address)
+
+    def receive(self) -> list[tuple[bytes, tuple[str, int]]]:
+        self.flush()
+        packets = []
+        while True:
+            try:
+                data, address = self.sock.recvfrom(65536)
+            except (BlockingIOError, ConnectionResetError):
+                return packets
+            self.bytes_received += len(data)
+            packets.append((data, address))
+
+    def close(self):
+        self.flush(everything=True)
+        self.sock.close()
+
+    def stats(self) -> str:
+        return f"LossyLink: {self.sent} sent, {self.dropped} dropped, {self.bytes_sent} bytes out, {self.bytes_received} bytes in"
+
+
+@dataclass
+class RemoteClient:
+    """What the server knows about one client."""
+
+    address: tuple[str, int]
+    slot: int  # Index of the player it controls
+    inputs: dict[int, int] = field(default_factory=dict)  # Sequence -> controls bitmask, not applied yet
+    applied: int = 0  # Last sequence applied, the client replays its inputs after it
+    mask: int = 0  # Controls held, repeated when no input is waiting
+    acked: int = NO_BASELINE  # Newest tick it said it got
+    coarse: dict[int, WorldState] = field(default_factory=dict)  # Ticks it got a coarser state than the one sent to everyone else, those are its baselines
+    heard: float = 0.0  # perf_counter() of its last packet
+
+    # Stats
+    skipped_inputs: int = 0
+    repeated_inputs: int = 0
+
+
+@dataclass
+class Server:
+    """Authoritative side: runs the game, takes inputs from clients, and sends each one a world state delta against the last state it acked.
+
+    A client that hasn't acked anything, or acked something too old, gets a full state."""
+
+    link: LossyLink
+    codec: WorldCodec
+    welcome: dict  # Settings a client needs to build the same world
+    actions: list[str]
+    slots: int = 1  # Players besides the host
+    max_queued_inputs: int = 4  # More than this waiting means the client got ahead, the oldest are skipped
+
+    # Stats
+    ticks: int = 0
+    full_states: int = 0
+    coarse_states: int = 0  # Too big for one datagram, so sent with part of the entities left out
+    malformed: int = 0  # Packets dropped because they were cut short, of an unknown kind or garbage
+
+    def __post_init__(self):
+        self.clients: dict[tuple[str, int], RemoteClient] = {}
+        self.sent: dict[int, WorldState] = {}
+        self.tick_bytes: list[int] = []  # Sent to all clients, per tick
+        self.raw_bytes: list[int] = []  # What one full state would have been, per tick
+
+    def poll(self):
+        for data, address in self.link.receive():
+            if not data or data[0] not in (HELLO, INPUT, BYE) or data[0] == INPUT and len(data) < INPUT_HEADER.size:
+                self.malformed += 1
+                continue
+            kind = data[0]
+            client = self.clients.get(address)
+            if kind == HELLO:
+                if client is None:
+                    taken = {client.slot for client in self.clients.values()}
+                    free = [slot for slot in range(1, self.slots + 1) if slot not in taken]
+                    try:
+                        version = parse_json(data).get("version")
+                    except ValueError:
+                        self.malformed += 1
+                        continue
+                    if not free or version != PROTOCOL_VERSION:
+                        continue
+                    client = self.clients[address] = RemoteClient(address, free[0])
+                    print(f"Server: {address[0]}:{address[1]} joined as player {client.slot + 1}")
+                client.heard = perf_counter()
+                self.link.send(bytes([WELCOME]) + json.dumps(self.welcome | {"slot": client.slot}).encode(), address)  # Again if it asks again, the first one got lost
+            elif kind == INPUT and client is not None:
+                _, acked, newest, count = INPUT_HEADER.unpack_from(data)
+                if len(data) != INPUT_HEADER.size + count * 2 or count > newest:
+                    self.malformed += 1
+                    continue
+                client.heard = perf_counter()
+                client.acked = max(client.acked, acked)
+                masks = np.frombuffer(data, dtype=np.uint16, count=count, offset=INPUT_HEADER.size).tolist()
+                for sequence, mask in zip(range(newest - count + 1, newest + 1), masks):
+                    if sequence > client.applied:
+                        client.inputs[sequence] = mask
+            elif kind == BYE and client is not None:
+                print(f"Server: player {client.slot + 1} left")
+                del self.clients[address]
+        now = perf_counter()
+        for address, client in list(self.clients.items()):
+            if now - client.heard > TIMEOUT:
+                print(f"Server: player {client.slot + 1} timed out")
+                del self.clients[address]
+
+    def controls(self, slot: int) -> dict[str, bool] | None:
+        """The next input of the client playing slot, for one simulation step. None while nobody is.
+
+        One is applied per step in sequence order. When none has come in yet the held controls repeat, and a late one is applied a step late instead of being dropped."""
+        client = next((client for client in self.clients.values() if client.slot == slot), None)
+        if client is None:
+            return None
+        while len(client.inputs) > self.max_queued_inputs:
+            del client.inputs[min(client.inputs)]
+            client.skipped_inputs += 1
+        if client.inputs:
+            client.applied = min(client.inputs)
+            client.mask = client.inputs.pop(client.applied)
+        else:
+            client.repeated_inputs += 1
+        return unpack_controls(client.mask, self.actions)
+
+    def send(self, state: WorldState):
+        self.sent[state.tick] = state
+        for tick in [tick for tick in self.sent if tick <= state.tick - BASELINE_WINDOW]:
+            del self.sent[tick]
+        total = 0
+        for client in self.clients.values():
+            for tick in [tick for tick in client.coarse if tick <= state.tick - BASELINE_WINDOW]:
+                del client.coarse[tick]
+            baseline = client.coarse.get(client.acked) or self.sent.get(client.acked)
+            if baseline is None:
+                self.full_states += 1
+            header = SNAPSHOT_HEADER.pack(SNAPSHOT, state.tick, baseline.tick if baseline else NO_BASELINE, client.applied)
+            sent = state
+            packet = header + self.codec.encode(sent, baseline)
+            while len(packet) > MAX_DATAGRAM:
+                sent = self.codec.coarser(sent)
+                packet = header + self.codec.encode(sent, baseline)
+            if sent is not state:
+                if not self.coarse_states:
+                    print(f"Server: a {state.nbytes()} byte world state doesn't fit in a datagram, sending coarser ones")
+                self.coarse_states += 1
+                client.coarse[state.tick] = sent
+            self.link.send(packet, client.address)
+            total += len(packet)
+        self.link.flush()
+        if self.clients:
+            self.ticks += 1
+            self.tick_bytes.append(total)
+            self.raw_bytes.append(SNAPSHOT_HEADER.size + state.nbytes())
+
+    def wait_for_clients(self, timeout: float) -> bool:
+        """Block until every slot is taken or timeout seconds pass."""
+        end = perf_counter() + timeout
+        while len(self.clients) < self.slots and perf_counter() < end:
+            self.poll()
+            sleep(0.01)
+        return len(self.clients) == self.slots
+
+    def close(self):
+        for client in self.clients.values():
+            for _ in range(3):  # Nothing comes back to say it arrived
+                self.link.send(bytes([BYE]), client.address)
+        self.link.close()
+
+    def summary(self) -> dict:
+        sent = np.array(self.tick_bytes or [0])
+        return {
+            "clients": len(self.clients),
+            "ticks": self.ticks,
+            "full_states": self.full_states,
+            "coarse_states": self.coarse_states,
+            "malformed": self.malformed,
+            "bytes_per_tick": {"mean": float(sent.mean()), "p99": float(np.percentile(sent, 99)), "max": int(sent.max())},
+            "raw_bytes_per_tick": float(np.mean(self.raw_bytes or [0])),
+            "skipped_inputs": sum(client.skipped_inputs for client in self.clients.values()),
+            "repeated_inputs": sum(client.repeated_inputs for client in self.clients.values()),
+            "link": {"sent": self.link.sent, "dropped": self.link.dropped, "bytes_sent": self.link.bytes_sent, "bytes_received": self.link.bytes_received},
+        }
+
+    def stats(self) -> str:
+        if not self.tick_bytes:
+            return "Server: no ticks sent"
+        recent = self.tick_bytes[-100:]
+        return f"Server: {len(self.clients)} clients, {np.mean(recent):.0f} bytes per tick (full state {np.mean(self.raw_bytes[-100:]):.0f}), {self.full_states} full states sent, {self.coarse_states} coarser, {self.malformed} malformed packets"
+
+
+@dataclass
+class Client:
+    """Joins a server, sends inputs with the last few resent each time, and decodes the world state deltas it gets back."""
+
+    link: LossyLink
+    server: tuple[str, int]
+    codec: WorldCodec | None = None  # Made once the server's welcome says what the layout is
+    actions: list[str] = field(default_factory=list)
+    closed: bool = False
+
+    # Stats
+    received: int = 0
+    lost: int = 0  # Ticks that never arrived
+    stale: int = 0  # Arrived after a newer one
+    undecodable: int = 0  # Their baseline was already dropped
+    malformed: int = 0  # Packets dropped because they were cut short, of an unknown kind or garbage
+    input_packets: int = 0
+
+    def __post_init__(self):
+        self.states: dict[int, WorldState] = {}
+        self.newest = NO_BASELINE
+        self.sequence = 0
+        self.masks = deque(maxlen=INPUT_REDUNDANCY)
+        self.heard = perf_counter()
+        self.tick_interval = 1
+
+    def join(self, timeout: float = 10.0) -> dict:
+        """Say hello until the server answers with its welcome, which has the settings, our player slot and the wire layout."""
+        end = perf_counter() + timeout
+        while perf_counter() < end:
+            self.link.send(bytes([HELLO]) + json.dumps({"version": PROTOCOL_VERSION}).encode(), self.server)
+            for _ in range(25):
+                for data, address in self.link.receive():
+                    if address != self.server or not data or data[0] != WELCOME:
+                        continue
+                    try:
+                        welcome = parse_json(data)
+                        self.codec = WorldCodec(dict(welcome["layout"]))
+                        self.actions = list(welcome["actions"])
+                        self.tick_interval = int(welcome["tick_interval"])
+                    except MALFORMED:
+                        self.malformed += 1
+                        continue
+                    self.heard = perf_counter()
+                    return welcome
+                sleep(0.01)
+        raise ConnectionError(f"No answer from {self.server[0]}:{self.server[1]}")
+
+    def send_input(self, controls: dict[str, bool]) -> int:
+        """Send this step's controls, returns its sequence number."""
+        self.sequence += 1
+        self.masks.append(pack_controls(controls, self.actions))
+        packet = INPUT_HEADER.pack(INPUT, self.newest, self.sequence, len(self.masks)) + np.array(self.masks, dtype=np.uint16).tobytes()
+        self.link.send(packet, self.server)
+        self.link.flush()
+        self.input_packets += 1
+        return self.sequence
+
+    def receive(self) -> list[tuple[WorldState, int]]:
+        """New world states since the last call, oldest first, each with the last input sequence the server had applied."""
+        states = []
+        for data, address in self.link.receive():
+            if address != self.server:
+                continue
+            if not data or data[0] not in (WELCOME, SNAPSHOT, BYE) or data[0] == SNAPSHOT and len(data) < SNAPSHOT_HEADER.size:
+                self.malformed += 1
+                continue
+            self.heard = perf_counter()
+            if data[0] == BYE:
+                self.closed = True
+            elif data[0] == SNAPSHOT:
+                _, tick, baseline, applied = SNAPSHOT_HEADER.unpack_from(data)
+                if tick <= self.newest:
+                    self.stale += 1
+                    continue
+                if baseline != NO_BASELINE and baseline not in self.states:
+                    self.undecodable += 1
+                    continue
+                try:
+                    state = self.codec.decode(tick, data[SNAPSHOT_HEADER.size :], self.states.get(baseline))
+                except MALFORMED:
+                    self.malformed += 1
+                    continue
+                if self.newest != NO_BASELINE:
+                    self.lost += max((tick - self.newest) // self.tick_interval - 1, 0)
+                self.newest = tick
+                self.received += 1
+                self.states[tick] = state
+                states.append((state, applied))
+        for tick in [tick for tick in self.states if tick <= self.newest - BASELINE_WINDOW]:
+            del self.states[tick]
+        if perf_counter() - self.heard > TIMEOUT:
+            self.closed = True
+        return states
+
+    def close(self):
+        for _ in range(3):
+            self.link.send(bytes([BYE]), self.server)
+        self.link.close()
+
+    def summary(self) -> dict:
+        return {
+            "received": self.received,
+            "lost": self.lost,
+            "stale": self.stale,
+            "undecodable": self.undecodable,
+            "malformed": self.malformed,
+            "input_packets": self.input_packets,
+            "input_bytes_per_packet": self.link.bytes_sent / max(self.link.sent, 1),
+            "bytes_received": self.link.bytes_received,
+            "link": {"sent": self.link.sent, "dropped": self.link.dropped, "bytes_sent": self.link.bytes_sent, "bytes_received": self.link.bytes_received},
+        }
+
+    def stats(self) -> str:
+        return f"Client: {self.received} states received, {self.lost} lost, {self.stale} stale, {self.undecodable} undecodable, {self.malformed} malformed, {self.link.bytes_received / max(self.received, 1):.0f} bytes per state"
@@ -0,0 +1,146 @@
+import csv
+import json
+import os
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from time import perf_counter
+
+import numpy as np
+import pygame as pg
+
+FRAME_BUDGET_MS = 1000 / 60
+
+
+@dataclass
+class Profiler:
+    """Times each phase of the main loop, keeping the last `history` frames (all of them if None)."""
+
+    history: int | None = 600
+    phases: list[str] = field(default_factory=list)
+    enabled: bool = True
+    overlay: bool = False
+
+    def __post_init__(self):
+        self.frames = deque(maxlen=self.history)
+        self.current = {}
+        self.last = perf_counter()
+        self.font = None
+
+    def begin_frame(self):
+        self.current = {}
+        self.last = perf_counter()
+
+    def mark(self, phase: str):
+        """Charge the time since the previous mark to this phase."""
+        if not self.enabled:
+            return
+        now = perf_counter()
+        self.current[phase] = self.current.get(phase, 0.0) + (now - self.last) * 1000
+        self.last = now
+        if phase not in self.phases:
+            self.phases.append(phase)
+
+    def end_frame(self, frame: int):
+        if self.enabled:
+            self.frames.append((frame, self.current))
+
+    def frame_times(self) -> np.ndarray:
+        return np.array([sum(times.values()) for _, times in self.frames])
+
+    def phase_times(self, phase: str) -> np.ndarray:
+        return np.array([times.get(phase, 0.0) for _, times in self.frames])
+
+    def summary(self) -> dict:
+        """Mean, p50 and p99 in ms, for whole frames and for each phase."""
+
+        def stats(times):
+            return {"mean": float(np.mean(times)), "p50": float(np.percentile(times, 50)), "p99": float(np.percentile(times, 99))}
+
+        return {
+            "frames": len(self.frames),
+            "over_budget": int(np.sum(self.frame_times() > FRAME_BUDGET_MS)),
+            "frame_ms": stats(self.frame_times()),
+            "phase_ms": {phase: stats(self.phase_times(phase)) for phase in self.phases},
+        }
+
+    def export(self, path: str):
+        """Dump the recorded timeline, as CSV or JSON depending on the extension."""
+        rows = [{"frame": frame, **{phase: times.get(phase, 0.0) for phase in self.phases}, "total": sum(times.values())} for frame, times in self.frames]
+        if path.endswith(".csv"):
+            with open(path, "w", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=["frame", *self.phases, "total"])
+                writer.writeheader()
+                writer.writerows(rows)
+        else:
+            with open(path, "w") as f:
+                json.dump({"phases": self.phases, "frames": rows}, f)
+
+    def draw_overlay(self, screen: pg.Surface, bar_frames: int = 240):
+        """Last frames as stacked per-phase bars against the frame budget, plus recent averages."""
+        if self.font is None:
+            self.font = pg.font.Font(None, 22)
+        colors = []
+        for i in range(len(self.phases)):
+            color = pg.Color(0, 0, 0)
+            color.hsva = (i * 360 / len(self.phases), 70, 100, 100)
+            colors.append(color)
+
+        x0, y0, scale = 10, 10 + 120, 120 / (FRAME_BUDGET_MS * 2)  # Bars are 2 budgets high
+        recent = list(self.frames)[-bar_frames:]
+        for x, (_, times) in enumerate(recent):
+            y = y0
+            for phase, color in zip(self.phases, colors):
+                height = times.get(phase, 0.0) * scale
+                pg.draw.line(screen, color, (x0 + x, y), (x0 + x, y - height))
+                y -= height
+        budget_y = y0 - FRAME_BUDGET_MS * scale
+        pg.draw.line(screen, (255, 60, 60), (x0, budget_y), (x0 + bar_frames, budget_y))
+
+        y = y0 + 6
+        for phase, color in zip(self.phases, colors):
+            times = [times.get(phase, 0.0) for _, times in recent[-60:]]
+            text = self.font.render(f"{phase:<16} {np.mean(times) if times else 0:6.2f} ms  max {max(times, default=0):6.2f}", True, color)
+            screen.blit(text, (x0, y))
+            y += 18
+
+
+def process_started() -> float:
+    """When this process started, on the perf_counter clock, so startup timing includes the interpreter and imports.
+    Needs Linux's /proc, elsewhere it's just now."""
+    try:
+        with open("/proc/self/stat") as f:
+            started_ticks = int(f.read().rpartition(")")[2].split()[19])
+        since_start = time.clock_gettime(time.CLOCK_BOOTTIME) - started_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return perf_counter()
+    return perf_counter() - since_start
+
+
+@dataclass
+class StartupTimer:
+    """Wall time of each startup step, from when the process started until the first frame is on screen."""
+
+    start: float
+    steps: dict[str, float] = field(default_factory=dict)
+
+    def __post_init__(self):
+        self.last = self.start
+
+    def mark(self, step: str):
+        """Charge the time since the previous mark to this step."""
+        now = perf_counter()
+        self.steps[step] = self.steps.get(step, 0.0) + (now - self.last) * 1000
+        self.last = now
+
+    @property
+    def total(self) -> float:
+        return sum(self.steps.values())
+
+    def summary(self, atlas) -> dict:
+        """Steps, plus how much of them went to sprites: decoding PNGs, scaling and rotating, and converting from the atlas cache."""
+        return self.steps | {"total": self.total, "images": {"decode": atlas.decode_ms, "scale": atlas.scale_ms, "from_cache": atlas.cache_ms}}
+
+    def format(self, atlas) -> str:
+        steps = ", ".join(f"{step} {ms:.0f}" for step, ms in self.steps.items())
+        return f"Startup: {self.total:.0f} ms to the first frame ({steps}), images: {atlas.decode_ms:.0f} decoding, {atlas.scale_ms:.0f} scaling, {atlas.cache_ms:.0f} from cache"
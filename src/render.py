@@ -0,0 +1,257 @@
+from dataclasses import dataclass, field
+from itertools import repeat
+from math import ceil, cos, isnan, radians, sin
+from typing import ClassVar
+from weakref import WeakKeyDictionary
+
+import numpy as np
+import pygame as pg
+from pygame import Rect, Surface
+from pygame._sdl2.video import Renderer, Texture
+
+from sprite_cache import TransformCache
+
+
+@dataclass
+class SurfaceRenderer:
+    """Default path: clear, draw the whole background and everything else, then flip."""
+
+    screen: Surface
+    background: Surface
+
+    native_transforms: ClassVar[bool] = False
+
+    def draw_background(self, bg_x1: float, bg_x2: float):
+        self.screen.fill((0, 0, 0))
+        self.screen.blit(self.background, (round(bg_x1), 0))
+        self.screen.blit(self.background, (round(bg_x2), 0))
+
+    def blit(self, surface: Surface, position):
+        self.screen.blit(surface, position)
+
+    def blits(self, sequence):
+        self.screen.blits(sequence, doreturn=False)
+
+    def invalidate(self):
+        pass
+
+    def present(self):
+        pg.display.flip()
+
+    def stats(self) -> str:
+        return "SurfaceRenderer"
+
+
+@dataclass
+class DirtyRectRenderer:
+    """Only restores and pushes the regions sprites touched, on frames where the background didn't scroll a whole pixel.
+
+    The background is pre-composed into one wrap-around strip, so even full frames are a single blit."""
+
+    screen: Surface
+    background: Surface
+    rects: list[Rect] = field(default_factory=list)
+    last_rects: list[Rect] = field(default_factory=list)
+
+    native_transforms: ClassVar[bool] = False
+
+    # Stats
+    full_frames: int = 0
+    partial_frames: int = 0
+    pixels_pushed: int = 0
+
+    def __post_init__(self):
+        self.period = self.background.get_width()
+        screen_width, screen_height = self.screen.get_size()
+        self.strip = Surface((self.period * ceil(screen_width / self.period + 1), screen_height)).convert()
+        for x in range(0, self.strip.get_width(), self.period):
+            self.strip.blit(self.background, (x, 0))
+        self.offset = None
+        self.full = True
+
+    def draw_background(self, bg_x1: float, bg_x2: float):
+        # Both backgrounds are always exactly one period apart, so bg_x1 is enough
+        offset = -round(bg_x1) % self.period
+        self.full = offset != self.offset
+        self.offset = offset
+        if self.full:
+            self.screen.blit(self.strip, (0, 0), Rect((offset, 0), self.screen.get_size()))
+        else:
+            for rect in self.last_rects:
+                self.screen.blit(self.strip, rect, rect.move(offset, 0))
+        self.rects = []
+
+    def blit(self, surface: Surface, position):
+        self.rects.append(self.screen.blit(surface, position))
+
+    def blits(self, sequence):
+        self.rects.extend(self.screen.blits(sequence))
+
+    def invalidate(self):
+        """Redraw everything next frame, for things drawn outside the renderer (e.g. the profiler overlay)."""
+        self.offset = None
+
+    def present(self):
+        if self.full:
+            pg.display.flip()
+            self.full_frames += 1
+            self.pixels_pushed += self.screen.get_width() * self.screen.get_height()
+        else:
+            dirty = self.last_rects + self.rects
+            pg.display.update(dirty)
+            self.partial_frames += 1
+            self.pixels_pushed += sum(rect.width * rect.height for rect in dirty)
+        self.last_rects = self.rects
+
+    def stats(self) -> str:
+        frames = max(self.full_frames + self.partial_frames, 1)
+        screen_pixels = self.screen.get_width() * self.screen.get_height()
+        return f"DirtyRectRenderer: {self.full_frames} full, {self.partial_frames} partial frames, {self.pixels_pushed / frames / screen_pixels:.0%} of the screen pushed per frame"
+
+
+@dataclass
+class TextureRenderer:
+    """Every surface is uploaded once as a texture, and SDL's renderer rotates and fades sprites as it draws them, so no transformed copies are made.
+
+    screen isn't shown here, it's an overlay for the profiler, uploaded on frames something was drawn on it."""
+
+    screen: Surface
+    background: Surface
+    gpu: Renderer
+
+    native_transforms: ClassVar[bool] = True
+
+    # Stats
+    uploads: int = 0
+    draws: int = 0
+    frames: int = 0
+
+    def __post_init__(self):
+        self.textures: WeakKeyDictionary[Surface, tuple[Texture, int]] = WeakKeyDictionary()  # With the alpha the surface had, to go back to after a faded draw
+        self.overlay_texture = None
+        self.overlay = False
+
+    def texture(self, surface: Surface) -> tuple[Texture, int]:
+        entry = self.textures.get(surface)
+        if entry is None:
+            texture = Texture.from_surface(self.gpu, surface)
+            entry = self.textures[surface] = (texture, texture.alpha)
+            self.uploads += 1
+        return entry
+
+    def draw_background(self, bg_x1: float, bg_x2: float):
+        self.gpu.draw_color = (0, 0, 0, 255)
+        self.gpu.clear()
+        texture, _ = self.texture(self.background)
+        texture.draw(dstrect=(round(bg_x1), 0))
+        texture.draw(dstrect=(round(bg_x2), 0))
+
+    def blit(self, surface: Surface, position):
+        texture, alpha = self.texture(surface)
+        texture.alpha = alpha
+        texture.draw(dstrect=position)
+        self.draws += 1
+
+    def blits(self, sequence):
+        for surface, position in sequence:
+            self.blit(surface, position)
+
+    def draw_sprites(self, commands):
+        """Commands from RenderQueue, (surface, x, y, angle, alpha, centered) with x, y the top left of the rotated sprite like pg.transform.rotate would make it, or its center."""
+        for surface, x, y, angle, alpha, centered in commands:
+            texture, base_alpha = self.texture(surface)
+            texture.alpha = base_alpha if isnan(alpha) else min(max(round(alpha), 0), 255)
+            width, height = surface.get_size()
+            if not centered:
+                turn = radians(angle)
+                x += (width * abs(cos(turn)) + height * abs(sin(turn))) / 2
+                y += (width * abs(sin(turn)) + height * abs(cos(turn))) / 2
+            texture.draw(dstrect=(round(x - width / 2), round(y - height / 2), width, height), angle=-angle)  # SDL turns clockwise
+        self.draws += len(commands)
+
+    def invalidate(self):
+        """Called when the profiler overlay is on, so clear it for this frame's."""
+        self.screen.fill((0, 0, 0, 0))
+        self.overlay = True
+
+    def present(self):
+        if self.overlay:
+            if self.overlay_texture is None:
+                self.overlay_texture = Texture(self.gpu, self.screen.get_size(), streaming=True)
+                self.overlay_texture.blend_mode = pg.BLENDMODE_BLEND
+            self.overlay_texture.update(self.screen)
+            self.overlay_texture.draw()
+            self.overlay = False
+        self.gpu.present()
+        self.frames += 1
+
+    def stats(self) -> str:
+        return f"TextureRenderer: {len(self.textures)} textures, {self.uploads} uploads, {self.draws / max(self.frames, 1):.0f} draws per frame"
+
+
+@dataclass
+class RenderQueue:
+    """Draw commands collected for a frame, then submitted as one blits call per layer.
+
+    Layers are drawn in the order they were first queued in, and within a layer the commands are grouped by surface so SDL blits each source back to back.
+    Rotated or faded sprites go through the transform cache, alpha is never set on a shared surface.
+    With native set, for renderers that transform as they draw, commands keep their angle and alpha instead and go to draw_sprites."""
+
+    transform_cache: TransformCache
+    layers: dict[str, list] = field(default_factory=dict)
+    native: bool = False
+
+    # Stats
+    commands: int = 0
+    transformed: int = 0
+    calls: int = 0
+
+    def add(self, layer: str, surface: Surface, position, alpha: float | None = None):
+        if self.native:
+            self.layers.setdefault(layer, []).append((surface, *position[:2], 0.0, float("nan") if alpha is None else alpha, False))
+            return
+        if alpha is not None:
+            surface = self.transform_cache.rotate(surface, 0, alpha)
+            self.transformed += 1
+        self.layers.setdefault(layer, []).append((surface, position))
+
+    def extend(self, layer: str, images, x: np.ndarray, y: np.ndarray, angle: np.ndarray, alpha: np.ndarray, sprite_class: str = "", centered: bool = False):
+        """Queue a batch of sprites with their top left at x, y (or centered on it), rotated by angle and faded to alpha (NaN for as is)."""
+        commands = self.layers.setdefault(layer, [])
+        transformed = np.flatnonzero((angle != 0) | ~np.isnan(alpha)).tolist()
+        if self.native:
+            commands.extend(zip(images, x.tolist(), y.tolist(), angle.tolist(), alpha.tolist(), repeat(centered)))
+        elif centered:
+            for image, sprite_x, sprite_y, sprite_angle, sprite_alpha in zip(images, x.tolist(), y.tolist(), angle.tolist(), alpha.tolist()):
+                image = self.transform_cache.rotate(image, sprite_angle, None if isnan(sprite_alpha) else sprite_alpha, sprite_class)
+                commands.append((image, image.get_rect(center=(sprite_x, sprite_y))))
+        else:
+            # Positions for the whole batch at once, only the transformed ones need a look at each sprite
+            images = list(images)
+            for i in transformed:
+                images[i] = self.transform_cache.rotate(images[i], float(angle[i]), None if isnan(alpha[i]) else float(alpha[i]), sprite_class)
+            commands.extend(zip(images, np.rint(np.column_stack([x, y])).astype(int).tolist()))
+        self.transformed += len(transformed)
+
+    def submit(self, renderer, mark=None):
+        """Draw everything queued and start over, calling mark(f"draw_{layer}") after each layer for the profiler."""
+        image_id = self.transform_cache.image_id
+        draw = renderer.draw_sprites if self.native else renderer.blits
+        for layer, commands in self.layers.items():
+            commands.sort(key=lambda command: image_id(command[0]))
+            draw(commands)
+            self.commands += len(commands)
+            self.calls += 1
+            if mark is not None:
+                mark(f"draw_{layer}")
+        self.layers.clear()
+
+    def stats(self) -> str:
+        return f"RenderQueue: {self.commands} commands in {self.calls} {'draw_sprites' if self.native else 'blits'} calls, {self.transformed} transformed"
+
+
+RENDERERS = {
+    "surface": SurfaceRenderer,
+    "dirty": DirtyRectRenderer,
+    "texture": TextureRenderer,
+}
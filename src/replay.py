@@ -0,0 +1,72 @@
+import json
+import struct
+from dataclasses import dataclass, field
+from typing import BinaryIO
+
+REPLAY_MAGIC = b"SHMR"
+REPLAY_VERSION = 2
+FRAME_FORMAT = struct.Struct("<dI")  # dt, bitmask of held actions
+
+
+@dataclass
+class Recorder:
+    """Writes the seed, settings and each frame's dt and controls to a compact binary replay file.
+
+    File layout: magic, version byte, header length (u32) and JSON header, then one FRAME_FORMAT record per frame."""
+
+    path: str
+    header: dict  # Must have "actions", the names bits in the bitmask stand for
+    file: BinaryIO | None = None
+    frames: int = 0
+
+    def __post_init__(self):
+        self.bits = {action: 1 << i for i, action in enumerate(self.header["actions"])}
+        header = json.dumps(self.header).encode()
+        self.file = open(self.path, "wb")
+        self.file.write(REPLAY_MAGIC + bytes([REPLAY_VERSION]) + struct.pack("<I", len(header)) + header)
+
+    def record(self, dt: float, controls: dict[str, bool]):
+        mask = 0
+        for action in controls:
+            mask |= self.bits.get(action, 0)
+        self.file.write(FRAME_FORMAT.pack(dt, mask))
+        self.frames += 1
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+@dataclass
+class Replay:
+    """Reads a file written by Recorder, frame() gives back each frame's dt and controls."""
+
+    path: str
+    header: dict = field(default_factory=dict)
+    frames: list[tuple[float, dict[str, bool]]] = field(default_factory=list)
+
+    def __post_init__(self):
+        with open(self.path, "rb") as f:
+            data = f.read()
+        if data[:4] != REPLAY_MAGIC or data[4] != REPLAY_VERSION:
+            raise ValueError(f"Not a version {REPLAY_VERSION} replay file: {self.path}")
+        (header_length,) = struct.unpack_from("<I", data, 5)
+        offset = 9 + header_length
+        self.header = json.loads(data[9:offset])
+        actions = self.header["actions"]
+
+        # Decode every distinct mask only once
+        controls_by_mask = {}
+        usable = (len(data) - offset) // FRAME_FORMAT.size * FRAME_FORMAT.size  # Drop a torn last record
+        for dt, mask in FRAME_FORMAT.iter_unpack(data[offset : offset + usable]):
+            if mask not in controls_by_mask:
+                controls_by_mask[mask] = {action: True for i, action in enumerate(actions) if mask & (1 << i)}
+            self.frames.append((dt, controls_by_mask[mask]))
+
+    def __len__(self):
+        return len(self.frames)
+
+    def frame(self, index: int) -> tuple[float, dict[str, bool]]:
+        dt, controls = self.frames[index]
+        return dt, dict(controls)  # The main loop adds to controls
@@ -1,26 +1,171 @@
+import argparse
+import hashlib
+import json
+import os
 import random
 import sys
-from dataclasses import dataclass, field
-from datetime import datetime
-from math import sqrt
+from collections import deque
+from dataclasses import dataclass, field, replace
+from itertools import repeat
+from math import ceil, hypot, inf, sqrt
+from time import perf_counter
 from typing import Optional
 
+import numpy as np
 import pygame as pg
-from dateutil.relativedelta import relativedelta
-from pygame import Rect, Surface
+from pygame import Surface
+from pygame._sdl2.video import Renderer, Texture, Window
+
+from assets import AssetAtlas
+from bullets import BulletPool
+from effects import FRAME_COUNT, Explosions
+from gameclock import Cooldown, FixedStep, GameClock
+from inputs import InputState
+from memory import MemoryMonitor, count_instances
+from net import Client, LossyLink, Server, parse_address
+from profiler import Profiler, StartupTimer, process_started
+from render import RENDERERS, RenderQueue, TextureRenderer
+from replay import Recorder, Replay
+from snapshot import (
+    SimulationThread,
+    Snapshot,
+    Sprites,
+    Timeline,
+    blend,
+    blend_factor,
+    frozen,
+)
+from spatial import GridIndex
+from sprite_cache import TransformCache, surface_bytes
+from swarm import Swarm
 from utils import FloatRect
+from waves import FORMATIONS, AlienPool, WaveScheduler, load_level
+from wire import WorldCodec, WorldState, quantize
+
+parser = argparse.ArgumentParser(description="Shmup Game")
+parser.add_argument("--headless", action="store_true", help="no window or audio, scripted inputs, one step per frame, unthrottled")
+parser.add_argument("--seed", type=int, help="seed for random (headless default: 0)")
+parser.add_argument("--frames", type=int, help="quit after this many frames")
+parser.add_argument("--step-rate", type=float, default=60, help="simulation steps per second, every step advances the game by the same time")
+parser.add_argument("--max-substeps", type=int, default=5, help="most steps run to catch up in one frame, the game slows down past that")
+parser.add_argument("--report", help="write per-phase frame timings as JSON to this file when quitting (- for stdout)")
+parser.add_argument("--level", default="data/levels/classic.json", help="level file (.json or .toml) with the alien types and waves")
+parser.add_argument("--aliens", help="comma separated counts overriding every wave of the level's alien types, in order (e.g. 10,4,3,1)")
+parser.add_argument("--fire-rate", type=float, default=1.0, help="alien fire rate multiplier, 0 for aliens that never fire")
+parser.add_argument("--cull-margin", type=float, default=100, help="pixels a bullet can get outside the screen before it's dropped")
+parser.add_argument("--stars", type=float, default=1.0, help="star count multiplier")
+parser.add_argument("--renderer", default="surface", choices=RENDERERS, help="surface: full redraw and flip, dirty: only push changed regions, texture: SDL renderer with textures (SDL_RENDER_DRIVER=software to force the software one)")
+parser.add_argument("--resolution", default="1920x1080", help="WIDTHxHEIGHT")
+parser.add_argument("--asset-cache", default=".cache/atlas.pickle", help="sprite atlas cache file (empty to disable)")
+parser.add_argument("--profile", help="dump the per-phase frame timeline to this .csv or .json file when quitting")
+parser.add_argument("--profile-overlay", action="store_true", help="start with the profiler overlay shown (toggle with F3)")
+parser.add_argument("--record", help="record the seed, settings and every frame's dt and controls to this replay file")
+parser.add_argument("--replay", help="play back a recorded replay file instead of reading inputs")
+parser.add_argument("--memory", type=int, metavar="FRAMES", help="track memory with tracemalloc and surface accounting, reporting every FRAMES frames (slow)")
+parser.add_argument("--unthrottled", action="store_true", help="don't limit the frame rate (implied by --headless)")
+parser.add_argument("--sim", default="serial", choices=["serial", "threaded"], help="serial: simulate then draw each frame, threaded: simulate on a worker thread and draw blended snapshots")
+parser.add_argument("--host", metavar="[HOST:]PORT", help="run a co-op game as its server on this UDP port, a second player can --join it")
+parser.add_argument("--join", metavar="HOST:PORT", help="join a co-op game as the second player, the settings come from the server")
+parser.add_argument("--tick-rate", type=float, default=30, help="world states a server sends per second")
+parser.add_argument("--net-latency", type=float, default=0, metavar="MS", help="hold everything this side sends for this long, for testing")
+parser.add_argument("--net-jitter", type=float, default=0, metavar="MS", help="plus or minus up to this much on top of --net-latency")
+parser.add_argument("--net-loss", type=float, default=0, metavar="FRACTION", help="drop this fraction of the packets this side sends")
+
+# Everything that changes how the simulation plays out, besides the inputs
+REPLAY_SETTINGS = ["seed", "level", "aliens", "fire_rate", "cull_margin", "stars", "resolution"]
+
+# Everything below that's None is set up by main(), importing the module only defines things
+args = None
+replay = None
+startup = None
+server = None
+net_client = None
+player_slot = 0  # Which of the players is played on this side
+
+
+def parse_args(argv: list[str] | None = None):
+    global args, replay
+    args = parser.parse_args(argv)
+    if (args.host or args.join) and args.sim == "threaded":
+        parser.error("co-op games only run with --sim serial")
+    if args.host and args.join:
+        parser.error("--host and --join don't go together")
+    if args.fire_rate < 0:
+        parser.error("--fire-rate can't be negative")
+    if args.cull_margin < 0:
+        parser.error("--cull-margin can't be negative")
+
+    if args.replay:
+        replay = Replay(args.replay)
+        for setting in REPLAY_SETTINGS:
+            setattr(args, setting, replay.header.get(setting, getattr(args, setting)))  # Replays from before a setting existed played with its default
+    if args.join:
+        join_game()
+
+    if args.headless:
+        os.environ["SDL_VIDEODRIVER"] = "dummy"
+        os.environ["SDL_AUDIODRIVER"] = "dummy"
+        if args.seed is None:
+            args.seed = 0
+    if args.record and args.seed is None:
+        args.seed = random.getrandbits(32)
+    if args.seed is not None:
+        random.seed(args.seed)
+
+
+def make_link(address: tuple[str, int] = ("0.0.0.0", 0)) -> LossyLink:
+    return LossyLink.bind(address, latency_ms=args.net_latency, jitter_ms=args.net_jitter, loss=args.net_loss)
+
+
+def join_game():
+    """Connect to the server and take over its settings, so this side builds the same world from the same seed."""
+    global net_client, player_slot
+    net_client = Client(make_link(), parse_address(args.join))
+    welcome = net_client.join()
+    for setting, value in welcome["settings"].items():
+        setattr(args, setting, value)
+    player_slot = welcome["slot"]
+    print(f"Client: joined {args.join} as player {player_slot + 1}")
+
+
+SCREEN_WIDTH, SCREEN_HEIGHT = 1920, 1080
+# FIXME: most code isn't resolution independent, and while other resolutions works, it changes gameplay
+screen = None
+gpu = None  # SDL renderer of the texture backend's window
+
+
+def init_display():
+    global SCREEN_WIDTH, SCREEN_HEIGHT, screen, gpu
+    pg.init()
+    SCREEN_WIDTH, SCREEN_HEIGHT = (int(size) for size in args.resolution.split("x"))
+    if args.renderer == "texture":
+        # The game gets its own window, the hidden display mode is only there so convert_alpha has a pixel format to go by
+        pg.display.set_mode((1, 1), pg.HIDDEN)
+        gpu = Renderer(Window("Shmup Game", (SCREEN_WIDTH, SCREEN_HEIGHT)), accelerated=0 if args.headless else -1)
+        screen = pg.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), pg.SRCALPHA)  # Offscreen, for the loading screen and the profiler overlay
+    else:
+        screen = pg.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+        pg.display.set_caption("Shmup Game")
 
-# Initialize Pygame
-pg.init()
 
-# Constants for screen size
-SCREEN_WIDTH = 1920
-SCREEN_HEIGHT = 1080
-# FIXME: most code isn't resolution independent, and while other resolutions works, it changes gameplay
+def draw_loading(message: str, progress: float):
+    """Loading screen between the startup steps, the window stays blank otherwise until the first frame."""
+    if args.headless:
+        return
+    pg.event.pump()  # So the window doesn't look hung
+    screen.fill((0, 0, 0))
+    text = pg.font.Font(None, 48).render(message, True, (220, 220, 220))
+    screen.blit(text, text.get_rect(center=(SCREEN_WIDTH / 2, SCREEN_HEIGHT / 2 - 30)))
+    bar = pg.Rect(0, 0, SCREEN_WIDTH / 3, 12)
+    bar.center = (SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2 + 20)
+    pg.draw.rect(screen, (220, 220, 220), (bar.x, bar.y, bar.width * progress, bar.height))
+    pg.draw.rect(screen, (120, 120, 120), bar, 1)
+    if gpu is None:
+        pg.display.flip()
+    else:
+        Texture.from_surface(gpu, screen).draw()
+        gpu.present()
 
-# Set up the display
-screen = pg.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-pg.display.set_caption("Shmup Game")
 
 # Controls
 CONTROLS = {
@@ -57,64 +202,48 @@ CONTROLS = {
     "quit": {
         "keyboard": [pg.K_ESCAPE],
     },
+    "profiler": {
+        "keyboard": [pg.K_F3],
+    },
 }
 
-joysticks = [pg.joystick.Joystick(joystick_id) for joystick_id in range(pg.joystick.get_count())]
+input_state = InputState(CONTROLS)  # Joysticks are picked up (and hot-plugged) through JOYDEVICEADDED events
 
 
 def get_controls() -> dict[str, bool]:
-    """Check input devices state and return control actions."""
-    controls = {}
-    pressed_keys = pg.key.get_pressed()
-    pressed_buttons = pg.mouse.get_pressed()
-
-    for event in pg.event.get():
-        if event.type == pg.QUIT:
-            controls["quit"] = True
-
-    for action, control in CONTROLS.items():
-        # Check keyboard
-        for key in control["keyboard"]:
-            if pressed_keys[key]:
-                controls[action] = True
-
-        # Check joystick
-        for joystick in joysticks:
-            # Joystick buttons
-            if "joystick_button" in control and joystick.get_button(control["joystick_button"]):
-                controls[action] = True
-
-            # Joystick axes
-            if "joystick_axis" in control:
-                axis, direction = control["joystick_axis"]
-                if joystick.get_axis(axis) * direction > 0.5:
-                    controls[action] = True
-
-            # Joystick hat (D-pad)
-            if "joystick_hat" in control:
-                axis, direction = control["joystick_hat"]
-                if joystick.get_numhats() > 0:
-                    hat_state = joystick.get_hat(0)
-                    if hat_state[axis] == direction:
-                        controls[action] = True
-
-        # Check mouse
-        if "mouse_button" in control:
-            if pressed_buttons[control["mouse_button"]]:
-                controls[action] = True
+    """Apply pending input events and return control actions."""
+    return input_state.poll()
+
+
+def scripted_controls(frame: int) -> dict[str, bool]:
+    """Deterministic stand-in for get_controls in headless runs: weave up and down while shooting, dash now and then."""
+    controls = {"shoot": True}
+    if frame % 240 < 60:
+        controls["up"] = True
+    elif 120 <= frame % 240 < 180:
+        controls["down"] = True
+    if frame % 600 < 40:
+        controls["dash"] = True
     return controls
 
 
-def load_image(name: str, size: int | None = None, rect_center: tuple[float, float] | None = None, size_by: str = "width"):
-    image = pg.image.load(f"data/{name}.png").convert_alpha()
+atlas = None
 
-    if size is not None:
-        if size_by == "width":
-            image = pg.transform.scale(image, (size, int(size * image.get_height() / image.get_width())))
-        elif size_by == "height":
-            image = pg.transform.scale(image, (int(size * image.get_width() / image.get_height()), size))
-        else:
-            raise ValueError(f"Invalid size_by option: {size_by}")
+
+def scaled_size(name: str, size: int | None = None, size_by: str = "width") -> tuple[int, int] | None:
+    if size is None:
+        return None
+    width, height = atlas.source_size(name)
+    if size_by == "width":
+        return (size, int(size * height / width))
+    elif size_by == "height":
+        return (int(size * width / height), size)
+    else:
+        raise ValueError(f"Invalid size_by option: {size_by}")
+
+
+def load_image(name: str, size: int | None = None, rect_center: tuple[float, float] | None = None, size_by: str = "width"):
+    image = atlas.get(name, scaled_size(name, size, size_by)).copy()
 
     if rect_center is not None:
         rect = FloatRect.from_rect(image.get_rect(center=rect_center))
@@ -123,66 +252,70 @@ def load_image(name: str, size: int | None = None, rect_center: tuple[float, flo
     return image
 
 
-rotate_cache = {}
+transform_cache = TransformCache(max_bytes=32 * 1024 * 1024, angle_steps={"bullet": 4, "ship": 1})
+render_queue = RenderQueue(transform_cache)
 
 
-def rotate_image(image, rect, angle, opacity: Optional[int] = None):
-    key = (image, angle)
-    rotated_image = rotate_cache.get(key)
-    if rotated_image is None:
-        rotated_image = pg.transform.rotate(image, angle)
-        rotate_cache[key] = rotated_image
+def rotate_image(image, rect, angle, opacity: Optional[int] = None, sprite_class: str = ""):
+    rotated_image = transform_cache.rotate(image, angle, opacity, sprite_class)
     if rect is not None:
         rotated_rect = rotated_image.get_rect(center=rect.center)
     else:
         rotated_rect = None
-    if opacity is not None:
-        rotated_image.set_alpha(opacity)
     return rotated_image, rotated_rect
 
 
 # Player, Alien, and bullet logic
-bullets = []
-player_bullet_image = load_image("blue_bullet", 17)
-alien_bullet_image = load_image("green_bullet", 20)
-alien_bullet_big_right_image = load_image("green_bullet_big", 40)
-alien_bullet_big_left_image = load_image("green_bullet_big", 30)
-explosion_image = load_image("explosion")
-
-
-@dataclass
-class Bullet:
-    image: Surface
-    rect: FloatRect
-    speed: int
-    direction: tuple[float, float]
-    target_type: str
-    active: bool = True
-
-    def update(self, shift_x, shift_y):
-        if bullet.active:
-            bullet.rect = bullet.rect.move(
-                (bullet.speed * bullet.direction[0]) * dt - shift_x,
-                (bullet.speed * bullet.direction[1]) * dt + shift_y,
-            )
-
-            if SCREEN_WIDTH + 250 < bullet.rect.centerx < 0 - 250 or SCREEN_HEIGHT + 250 < bullet.rect.centery < 0 - 250:
-                bullet.active = False
-
-            match bullet.target_type:
-                case "Alien":
-                    for alien in aliens:
-                        if alien.health > 0 and bullet.rect.colliderect(alien.rect):
-                            bullet.active = False
-                            alien.health -= 1
-                            if alien.health <= 0:
-                                alien.die()
-                case "Player":
-                    if not player.dashing and bullet.rect.colliderect(player.colliderect):
-                        bullet.active = False
-                        player.health -= 1
-                        if player.health <= 0:
-                            player.die()
+player_bullet_image = alien_bullet_image = alien_bullet_big_right_image = alien_bullet_big_left_image = bg_image = None
+
+
+def load_assets():
+    """The sprites everything else is built from, the aliens' own sizes are loaded when they're built."""
+    global atlas, player_bullet_image, alien_bullet_image, alien_bullet_big_right_image, alien_bullet_big_left_image, bg_image
+    atlas = AssetAtlas(cache_path=args.asset_cache or None)
+    player_bullet_image = load_image("blue_bullet", 17)
+    alien_bullet_image = load_image("green_bullet", 20)
+    alien_bullet_big_right_image = load_image("green_bullet_big", 40)
+    alien_bullet_big_left_image = load_image("green_bullet_big", 30)
+    bg_image = load_image("background_waifu2x_art_scan_noise3_scale", SCREEN_HEIGHT, size_by="height")
+
+
+bullets = None
+explosions = None
+
+
+def update_bullets(shift_x, shift_y):
+    bullets.move(dt, shift_x, shift_y)
+    bullets.cull(SCREEN_WIDTH, SCREEN_HEIGHT)
+
+    # Player bullets, rects first and then masks, every bullet that hits is used up (one overlapping two aliens hurts both, like it always did)
+    living = np.array([i for i in swarm.live.tolist() if aliens[i].health > 0], dtype=np.intp)
+    bullet_ids, targets = bullets.collide_many(swarm.grid, swarm.x[living], swarm.y[living], swarm.width[living], swarm.height[living], "Alien")
+    used = []
+    for target in np.unique(targets).tolist():
+        alien = aliens[living[target]]
+        hits = bullets.refine(np.sort(bullet_ids[targets == target]), transform_cache.mask(alien.hit_image), alien.rect.x, alien.rect.y)
+        if not hits.size:
+            continue
+        used.append(hits)
+        alien.health -= len(hits)
+        if alien.health <= 0:
+            alien.die()
+    if used:
+        bullets.kill(np.unique(np.concatenate(used)))
+
+    # Alien bullets
+    for being in active_players():
+        if being.dashing:
+            continue
+        mask = transform_cache.mask(being.hit_image, being.angle, "ship")
+        hitbox = FloatRect.from_rect(mask.get_rect(center=being.rect.center))
+        hits = bullets.refine(bullets.collide(hitbox, "Player"), mask, hitbox.x, hitbox.y)
+        if hits.size:
+            bullets.kill(hits)
+            being.health -= len(hits)
+            if being.health <= 0:
+                being.die()
 
 
 @dataclass
@@ -191,32 +324,26 @@ class BaseBeing:
 
     image: Surface
     rect: FloatRect
-    last_rect: FloatRect | None = None
     health: int = 5
-    bullet_image: Surface = player_bullet_image
-    shot_freq: relativedelta = relativedelta(microseconds=300000)
-    last_shot: datetime = datetime.now()
+    shot_cooldown: Cooldown = field(default_factory=lambda: Cooldown(0.3))
     target_type: str = "Alien"
     targeting_style: str = "random"
     movement_style: str = "follow"
     opacity: int = 220
 
     def __post_init__(self):
-        self.original_image = self.image.copy()
         self.original_health = self.health
         self.original_opacity = self.opacity
 
     def reset(self):
-        self.image = self.original_image.copy()
         self.health = self.original_health
         self.opacity = self.original_opacity
 
     def can_shoot(self):
         return self.health > 0
 
-    def shoot(self):
-        if datetime.now() > self.last_shot + self.shot_freq:
-            global bullets
+    def shoot(self, aim: float = 0.0):
+        if self.shot_cooldown.ready(game_clock.now):
             if isinstance(self, Alien):
                 if self.targeting_style == "random_xy":
                     direction = (random.random() - random.random(), random.random() - random.random())
@@ -226,15 +353,7 @@ class BaseBeing:
                     offsetx = -25
                     offsety = -30
 
-                    bullets.append(
-                        Bullet(
-                            alien_bullet_big_right_image,
-                            FloatRect(0, 0, 10, 10).move(self.rect.centerx + offsetx, self.rect.centery + offsety),
-                            speed=speed,
-                            direction=direction,
-                            target_type="Player",
-                        ),
-                    )
+                    bullets.spawn(alien_bullet_big_right_image, self.rect.centerx + offsetx, self.rect.centery + offsety, speed=speed, direction=direction, target_type="Player")
 
                     direction = (random.random() - random.random(), random.random() - random.random())
                     magnitude = sqrt(direction[0] ** 2 + direction[1] ** 2)
@@ -243,15 +362,7 @@ class BaseBeing:
                     offsetx = -85
                     offsety = -35
 
-                    bullets.append(
-                        Bullet(
-                            alien_bullet_big_left_image,
-                            FloatRect(0, 0, 10, 10).move(self.rect.centerx + offsetx, self.rect.centery + offsety),
-                            speed=speed,
-                            direction=direction,
-                            target_type="Player",
-                        ),
-                    )
+                    bullets.spawn(alien_bullet_big_left_image, self.rect.centerx + offsetx, self.rect.centery + offsety, speed=speed, direction=direction, target_type="Player")
                 else:
                     direction = (-1, 0.7 * ((random.random() + random.random() + random.random()) / 3 - 0.5))
                     magnitude = sqrt(direction[0] ** 2 + direction[1] ** 2)
@@ -264,39 +375,15 @@ class BaseBeing:
                     if self.targeting_style == "random_hit":
                         offsetx, offsety = random.choice([(-45, -10), (-65, -10)])
 
-                    bullets.append(
-                        Bullet(
-                            alien_bullet_image,
-                            FloatRect(0, 0, 10, 10).move(self.rect.centerx + offsetx, self.rect.centery + offsety),
-                            speed=speed,
-                            direction=direction,
-                            target_type="Player",
-                        ),
-                    )
+                    bullets.spawn(alien_bullet_image, self.rect.centerx + offsetx, self.rect.centery + offsety, speed=speed, direction=direction, target_type="Player")
             else:
-                bullets.extend(
-                    [
-                        Bullet(
-                            player_bullet_image,
-                            FloatRect(0, 0, 10, 10).move(self.rect.centerx - 15, self.rect.centery - 5 + 35),
-                            speed=25,
-                            direction=(1, -shift_y * 0.1),
-                            target_type="Alien",
-                        ),
-                        Bullet(
-                            player_bullet_image,
-                            FloatRect(0, 0, 10, 10).move(self.rect.centerx - 15, self.rect.centery - 5 - 35),
-                            speed=25,
-                            direction=(1, -shift_y * 0.1),
-                            target_type="Alien",
-                        ),
-                    ]
-                )
-            self.last_shot = datetime.now()
+                for offsety in (35, -35):
+                    bullets.spawn(player_bullet_image, self.rect.centerx - 15, self.rect.centery - 5 + offsety, speed=25, direction=(1, aim), target_type="Alien")
+            self.shot_cooldown.trigger(game_clock.now)
 
-    def die(self):
-        self.image = explosion_image.copy()
-        self.image = pg.transform.scale(self.image, self.rect.size)
+    def die(self, drift: float = 0):
+        """Hidden from now on, an explosion plays in its place."""
+        explosions.spawn(self.image.get_size(), self.rect.centerx, self.rect.centery, game_clock.now, dx=drift)
 
 
 @dataclass
@@ -304,10 +391,19 @@ class Player(BaseBeing):
     dash_fuel: float = 10
     dash_fuel_capacity: float = 30
     dashing: bool = False
+    tilt: float = 0.0  # Its last vertical shift, it leans into it
+    respawn: tuple[float, float] | None = None  # Top left to come back at, (SCREEN_WIDTH / 4, SCREEN_HEIGHT / 2) if None
+    last_controls: dict[str, bool] = field(default_factory=dict)
 
     def __post_init__(self):
         self.opacity = 200
         super().__post_init__()
+        self.hit_image = self.image.copy()  # Never drawn, so its masks can be made on demand even while the renderer is drawing image
+
+    @property
+    def angle(self) -> float:
+        """Tilt while moving up or down, hits use it too."""
+        return self.tilt * 1.5
 
     def update(self):
         if self.health <= 0:
@@ -318,150 +414,83 @@ class Player(BaseBeing):
                 if self.dash_fuel <= 0:
                     self.dashing = False
                 blinking_part = self.original_opacity / 2 if frame % 22 >= 11 else self.original_opacity / 6
-                fuel_depletion_part = self.original_opacity / 2 * (player.dash_fuel_capacity - player.dash_fuel) / player.dash_fuel_capacity
+                fuel_depletion_part = self.original_opacity / 2 * (self.dash_fuel_capacity - self.dash_fuel) / self.dash_fuel_capacity
                 self.opacity = int(blinking_part + fuel_depletion_part)
             elif self.dash_fuel < self.dash_fuel_capacity:
                 self.dash_fuel += 0.075 * dt
                 self.opacity = self.original_opacity
 
         if self.opacity < -1500:  # FIXME: should be time based, or on button
-            self.rect.x = SCREEN_WIDTH / 4
-            self.rect.y = SCREEN_HEIGHT / 2
+            self.rect.x, self.rect.y = self.respawn or (SCREEN_WIDTH / 4, SCREEN_HEIGHT / 2)
             self.reset()
 
-        self.colliderect = self.rect.scale_by(0.5, 0.5)
 
+player = None
+wingman = None  # Second player, in co-op games
 
-player = Player(*load_image("ship", 100, (SCREEN_WIDTH / 4, SCREEN_HEIGHT / 2)))
+
+def active_players() -> list[Player]:
+    """The host's player, plus the second one while someone's playing it."""
+    if wingman is None or server is not None and not server.clients:
+        return [player]
+    return [player, wingman]
 
 
 # Alien
 @dataclass
 class Alien(BaseBeing):
     speed: float = 4
+    kind: str = ""
+    shot_cooldown: Cooldown = field(default_factory=lambda: Cooldown(0.3 / args.fire_rate if args.fire_rate else inf))
+    hit_image: Surface | None = None  # The atlas variant image was copied from, shared by every alien of the same sprite and size and so are its masks
 
     def can_shoot(self):
         normal_part = (self.rect.x > player.rect.x and player.health > 0) or random.random() < 0.01
         big_part = self.targeting_style == "random_xy" and 0 < self.rect.centerx < SCREEN_WIDTH and 0 < self.rect.centery < SCREEN_HEIGHT
         return super().can_shoot() and (normal_part or big_part)
 
-    def update(self, shift_x, shift_y):
-        movement = self.speed  # Remaining movement
-
-        total_x = 0
-        total_y = 0
-
-        # Alien avoidance logic
-        for other in random.sample(aliens, len(aliens)):
-            if other != self and self.rect.colliderect(other.rect.inflate(15 + random.random() * 10, 15 + random.random() * 10)):
-                if self.rect.x < other.rect.x:
-                    total_x -= random.random()
-                else:
-                    total_x += random.random() * 0.5
-
-                if self.rect.y < other.rect.y:
-                    total_y -= random.random() * 2
-                else:
-                    total_y += random.random() * 2
-
-                break  # Collide only with one per frame
-
-        # Movement towards player
-        if self.movement_style == "follow":
-            ratio_y = 0.75 if player.rect.x < self.rect.x else 0.15
-
-            if player.rect.y > self.rect.y:
-                total_y += random.random() * ratio_y
-            else:
-                total_y -= random.random() * ratio_y
-
-        # General movement
-        total_x -= 1.5 + random.random() * 0.5
-
-        # Normalize the movement
-        movement_distance = sqrt(total_x**2 + total_y**2)
-        if movement_distance > 0:
-            normalized_x = total_x / movement_distance * movement
-            normalized_y = total_y / movement_distance * movement
+    def die(self):
+        super().die(drift=-self.speed)
 
-            self.rect.x += normalized_x * dt - shift_x
-            self.rect.y += normalized_y * dt + shift_y
 
-        if self.last_rect is None:
-            self.last_rect = self.rect.copy()
+# Waves, each alien type gets a pool of aliens with their sprites scaled up front, spawning only moves them into place
+level = None
+alien_counts = {}
 
-        # Smoothing, lol
-        self.rect = self.rect.move(
-            (self.rect.x - self.last_rect.x) * 0.15,
-            (self.rect.y - self.last_rect.y) * 0.15,
-        )
 
-        if self.health <= 0:
-            self.opacity -= 15 * dt
-
-        if self.rect.x < -300:
-            self.rect.x = SCREEN_WIDTH + 300 + random.random() * 500
-            self.rect.y = random.randint(-100, SCREEN_HEIGHT + 100)
-            self.reset()
+def make_alien(name: str) -> Alien:
+    alien_type = level.types[name]
+    hit_image = atlas.get(alien_type.image, scaled_size(alien_type.image, random.randint(*alien_type.sizes)))
+    image = hit_image.copy()
+    low, high = alien_type.speed
+    alien = Alien(
+        image,
+        FloatRect.from_rect(image.get_rect()),
+        kind=name,
+        hit_image=hit_image,
+        health=alien_type.health,
+        speed=low + random.random() * (high - low),
+        targeting_style=alien_type.targeting_style,
+        movement_style=alien_type.movement_style,
+    )
+    image.set_alpha(alien.opacity)  # Once, the image is never touched again
+    return alien
 
-        self.last_rect = self.rect.copy()
 
-        self.image.set_alpha(self.opacity)
+aliens = []
+alien_pools = {}
+live_aliens = []
+wave_scheduler = None
+swarm = None
 
 
-aliens = (
-    [
-        Alien(
-            *load_image(
-                "alien1",
-                int(90 + 25 * random.random()),
-                (SCREEN_WIDTH * 3 / 4 + random.randint(0, 1500), random.randint(100, SCREEN_HEIGHT - 100)),
-            ),
-            health=2,
-            speed=6 + random.random() * 2,
-        )
-        for _ in range(10)
-    ]
-    + [
-        Alien(
-            *load_image(
-                "alien2",
-                int(130 + 30 * random.random()),
-                (SCREEN_WIDTH * 3 / 4 + random.randint(0, 1500), random.randint(100, SCREEN_HEIGHT - 100)),
-            ),
-            targeting_style="random_hit",
-            health=8,
-            speed=2 + random.random(),
-        )
-        for _ in range(4)
-    ]
-    + [
-        Alien(
-            *load_image(
-                "alien3",
-                int(90 + 30 * random.random()),
-                (SCREEN_WIDTH * 3 / 4 + random.randint(0, 1500), random.randint(100, SCREEN_HEIGHT - 100)),
-            ),
-            targeting_style="mirror",
-            health=5,
-            speed=4 + random.random(),
-        )
-        for _ in range(3)
-    ]
-    + [
-        Alien(
-            *load_image(
-                "alien4",
-                250,
-                (3000, random.randint(100, SCREEN_HEIGHT - 100)),
-            ),
-            targeting_style="random_xy",
-            health=50,
-            speed=3,
-        )
-        for _ in range(1)
-    ]
-)
+def spawn_waves():
+    for wave in wave_scheduler.due(game_clock.now):
+        pool = alien_pools[wave.type]
+        for center in FORMATIONS[wave.formation](wave):
+            index = pool.acquire()
+            if index is not None:
+                swarm.activate(index, *center)
 
 
 # Stars
@@ -471,37 +500,91 @@ class StarLayer:
     count: int
     color: tuple[int, int, int]
     radius: float
-    stars: list[list[float]] = field(default_factory=list)
+    stars: np.ndarray = field(default_factory=lambda: np.zeros((0, 2)))
 
     def __post_init__(self):
-        self.stars = [[random.randint(0, SCREEN_WIDTH), random.randint(-SCREEN_HEIGHT, SCREEN_HEIGHT * 2)] for _ in range(self.count)]
-
-    def draw(self):
-        for star in self.stars:
-            if -self.radius < star[1] < SCREEN_HEIGHT + self.radius:
-                pg.draw.circle(screen, self.color, star, self.radius)
+        self.count = round(self.count * args.stars)
+        self.rng = np.random.default_rng(random.getrandbits(32))  # Follows the random seed
+        self.stars = np.column_stack(
+            [
+                self.rng.integers(0, SCREEN_WIDTH, self.count, endpoint=True),
+                self.rng.integers(-SCREEN_HEIGHT, SCREEN_HEIGHT * 2, self.count, endpoint=True),
+            ]
+        ).astype(float)
+
+        # All stars in a layer look the same, so draw one and stamp it everywhere
+        size = ceil(self.radius * 2) + 1
+        self.stamp = Surface((size, size))
+        self.stamp.set_colorkey((0, 0, 0))
+        pg.draw.circle(self.stamp, self.color, (size / 2, size / 2), self.radius)
+        self.stamp_offset = size / 2
+
+    def draw(self, stars: np.ndarray):
+        visible = stars[(-self.radius < stars[:, 1]) & (stars[:, 1] < SCREEN_HEIGHT + self.radius)]
+        positions = np.rint(visible - self.stamp_offset).astype(int).tolist()
+        renderer.blits(zip(repeat(self.stamp), positions))
 
     def update(self, shift_x, shift_y):
-        for star in self.stars:
-            star[0] -= self.speed * dt + shift_x * self.speed / 2
-            star[1] += shift_y
-            if star[0] < -self.radius:
-                star[0] = SCREEN_WIDTH + self.radius
-                star[1] = random.randint(-SCREEN_HEIGHT, SCREEN_HEIGHT * 2)
+        self.stars[:, 0] -= self.speed * dt + shift_x * self.speed / 2
+        self.stars[:, 1] += shift_y
+        wrapped = self.stars[:, 0] < -self.radius
+        if wrapped.any():
+            self.stars[wrapped, 0] = SCREEN_WIDTH + self.radius
+            self.stars[wrapped, 1] = self.rng.integers(-SCREEN_HEIGHT, SCREEN_HEIGHT * 2, np.count_nonzero(wrapped), endpoint=True)
 
 
-star_layers = [
-    StarLayer(speed=3.1, count=200, color=(240, 240, 240), radius=1.9),
-    StarLayer(speed=2.4, count=200, color=(220, 220, 220), radius=1.7),
-    StarLayer(speed=1.5, count=100, color=(150, 150, 150), radius=1.4),
-    StarLayer(speed=1.1, count=50, color=(75, 75, 75), radius=1.2),
-]
+star_layers = []
 
 # Background
-bg_image = load_image("background_waifu2x_art_scan_noise3_scale", SCREEN_HEIGHT, size_by="height")
 bg_x1 = 0.0
-bg_x2 = float(bg_image.get_width())
-print(bg_image.get_rect())
+bg_x2 = 0.0
+renderer = None
+
+
+def build_world(cull_margin: float):
+    """Everything the simulation works on, only what this run uses is scaled, the rest of the atlas stays on disk.
+
+    Bullets more than cull_margin pixels off screen are dropped."""
+    global bullets, explosions, player, wingman, level, alien_counts, aliens, wave_scheduler, swarm, star_layers, bg_x2, renderer
+    bullets = BulletPool([player_bullet_image, alien_bullet_image, alien_bullet_big_right_image, alien_bullet_big_left_image], cull_margin=cull_margin)
+    explosions = Explosions(atlas)
+    player = Player(*load_image("ship", 100, (SCREEN_WIDTH / 4, SCREEN_HEIGHT / 2)))
+    if args.host or args.join:
+        wingman = Player(*load_image("ship", 100, (SCREEN_WIDTH / 4, SCREEN_HEIGHT * 3 / 4)), respawn=(SCREEN_WIDTH / 4, SCREEN_HEIGHT * 3 / 4))
+
+    level = load_level(args.level)
+    if args.aliens:
+        for name, count in zip(level.types, args.aliens.split(",")):
+            for wave in level.waves:
+                if wave.type == name:
+                    wave.count = int(count)
+    alien_counts = level.counts()
+    aliens = []
+    for name in level.types:
+        alien_pools[name] = AlienPool(name, start=len(aliens), capacity=level.pool_size(name))
+        aliens += [make_alien(name) for _ in range(alien_pools[name].capacity)]
+    wave_scheduler = WaveScheduler(level)
+    swarm = Swarm(aliens, GridIndex(cell_size=160, debug=bool(os.environ.get("SHMUP_DEBUG_SPATIAL"))), seed=random.getrandbits(32), recycle=level.recycle)
+
+    star_layers = [
+        StarLayer(speed=3.1, count=200, color=(240, 240, 240), radius=1.9),
+        StarLayer(speed=2.4, count=200, color=(220, 220, 220), radius=1.7),
+        StarLayer(speed=1.5, count=100, color=(150, 150, 150), radius=1.4),
+        StarLayer(speed=1.1, count=50, color=(75, 75, 75), radius=1.2),
+    ]
+
+    # Explosions for the sizes that are actually out there, and the aliens' collision masks, which can't be made later while the renderer might be drawing them
+    for size in {alien.image.get_size() for alien in aliens} | {player.image.get_size()}:
+        explosions.bake(size)
+    for hit_image in {alien.hit_image for alien in aliens}:
+        transform_cache.mask(hit_image)
+
+    atlas.save()
+    print(atlas.stats())
+    bg_x2 = float(bg_image.get_width())
+    print(bg_image.get_rect())
+    renderer = TextureRenderer(screen, bg_image, gpu) if gpu else RENDERERS[args.renderer](screen, bg_image)
+    render_queue.native = renderer.native_transforms
 
 
 def update_background():
@@ -518,89 +601,284 @@ def update_background():
         bg_x2 += bg_image.get_width() * 2
 
 
-# Game loop
-frame = 0
-last_controls = {}
-clock = pg.time.Clock()
-while True:
-    frame += 1
+profiler = None
+sim_profiler = None
+
+
+def state_checksum() -> str:
+    """Hash of the simulation state, equal checksums mean a run was reproduced bit for bit."""
+    state = hashlib.sha1()
+    state.update(np.array([player.rect.x, player.rect.y, player.health, game_clock.now, bullets.live]).tobytes())
+    state.update(swarm.x.tobytes())
+    state.update(swarm.y.tobytes())
+    state.update(bullets.x[bullets.active].tobytes())
+    return state.hexdigest()
+
+
+def write_report():
+    report = {
+        "checksum": state_checksum(),
+        "seed": args.seed,
+        "renderer": args.renderer,
+        "sim": args.sim,
+        "resolution": [SCREEN_WIDTH, SCREEN_HEIGHT],
+        "level": args.level,
+        "aliens": alien_counts,
+        "fire_rate": args.fire_rate,
+        "step_rate": args.step_rate,
+        "dropped_ms": fixed_step.dropped_ms,
+        "alien_pools": {name: {"capacity": pool.capacity, "spawned": pool.hits, "dropped": pool.misses} for name, pool in alien_pools.items()},
+        "stars": sum(star_layer.count for star_layer in star_layers),
+        "peak_bullets": bullets.peak,
+        "startup_ms": startup.summary(atlas),
+        "narrowphase": {"tests": bullets.narrow_tests, "rejected": bullets.narrow_rejected, "ms": bullets.narrow_ms, "masks": len(transform_cache.masks)},
+    } | profiler.summary()
+    if sim_profiler is not profiler:
+        report["simulation"] = sim_profiler.summary()
+    if memory_monitor is not None:
+        if not memory_monitor.samples or memory_monitor.samples[-1]["frame"] != frame:
+            memory_monitor.sample(frame)  # Where the run ended, so even one shorter than --memory has a sample
+        report["memory"] = memory_monitor.summary()
+    if server is not None:
+        report["net"] = server.summary()
+    if net_client is not None:
+        report["net"] = net_client.summary() | {"prediction_error_px": prediction_summary(), "interpolation": {"underruns": timeline.underruns, "jumps": timeline.jumps}}
+    if args.report == "-":
+        print(json.dumps(report, indent=2))
+    else:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+def quit_game():
+    if sim_thread is not None:
+        sim_thread.stop()
+    if recorder is not None:
+        recorder.close()
+    if args.report:
+        write_report()
+    if server is not None:
+        server.close()
+    if net_client is not None:
+        net_client.close()
+    if args.profile:
+        profiler.export(args.profile)
+    atlas.save()  # Anything scaled on demand since startup
+    pg.quit()
+    sys.exit()
+
+
+def surface_stats() -> tuple[int, int]:
+    """Every distinct surface the game holds on to."""
+    surfaces = {id(surface): surface for surface in [*atlas.sources.values(), *atlas.variants.values(), *transform_cache.entries.values(), *bullets.images, bg_image, player.image, *(star_layer.stamp for star_layer in star_layers)]}
+    surfaces |= {id(surface): surface for surface in [*(alien.image for alien in aliens), *(frame for frames in explosions.animations for frame in frames)]}
+    if hasattr(renderer, "strip"):
+        surfaces[id(renderer.strip)] = renderer.strip
+    return len(surfaces), sum(surface_bytes(surface) for surface in surfaces.values())
+
+
+memory_monitor = None
+recorder = None
+
+
+def set_up_tools():
+    """Profiling, memory tracking and recording, as the arguments ask."""
+    global profiler, sim_profiler, memory_monitor, recorder, fixed_step, server, tick_interval
+    # All frames are kept when writing a report (except when tracking memory, they'd look like a leak)
+    profiler = Profiler(history=None if args.report and not args.memory else 600, overlay=args.profile_overlay)
+    sim_profiler = profiler if args.sim == "serial" else Profiler(history=profiler.history)  # Profiler isn't thread safe, the worker gets its own
+    if args.memory:
+        memory_monitor = MemoryMonitor(
+            {
+                "surfaces": surface_stats,
+                "atlas": lambda: (len(atlas.variants), sum(surface_bytes(surface) for surface in atlas.variants.values())),
+                "transform_cache": lambda: (len(transform_cache.entries), transform_cache.bytes),
+                "rects": lambda: count_instances(FloatRect),
+                "bullets": lambda: (bullets.live, bullets.nbytes()),
+            }
+        )
+    if args.record:
+        recorder = Recorder(args.record, {setting: getattr(args, setting) for setting in REPLAY_SETTINGS} | {"actions": list(CONTROLS)})
+    fixed_step = FixedStep(1000 / args.step_rate, args.max_substeps)
+    tick_interval = max(round(args.step_rate / args.tick_rate), 1)
+    if args.host:
+        welcome = {"settings": {setting: getattr(args, setting) for setting in [*REPLAY_SETTINGS, "step_rate"]}, "layout": NET_LAYOUT, "actions": list(CONTROLS), "tick_interval": tick_interval}
+        server = Server(make_link(parse_address(args.host)), WorldCodec(NET_LAYOUT), welcome, list(CONTROLS))
+        print(f"Server: listening on port {server.link.sock.getsockname()[1]}")
 
-    # Two difficulty factors here - it gets faster, and they shoot a bit more
-    speed_difficulty = 36 + frame * 0.00025
-    expected_dt = 1000 / (speed_difficulty)
-    dt = clock.tick(60) / expected_dt
 
-    frame_difficulty = (0.0010 + frame * 0.0000001) * dt
-    if frame % 300 == 0:
-        print("Difficulty", frame_difficulty, speed_difficulty)
-        print("FPS:", clock.get_fps())
-    shift_x = 0.0
-    shift_y = 0.0
+last_ui_controls = {}
 
-    # Process controls
-    controls = get_controls()
 
+def poll_input() -> dict[str, bool]:
+    """Controls from the real inputs, after handling the ones that aren't part of the simulation."""
+    global last_ui_controls
+    controls = get_controls()
     if "quit" in controls:
-        pg.quit()
-        sys.exit()
+        quit_game()
+    if "profiler" in controls and "profiler" not in last_ui_controls:
+        profiler.overlay = not profiler.overlay
+    last_ui_controls = controls
+    return controls
+
+
+# Co-op, the server sends world states quantized to int16 and delta compressed, clients predict their own player and draw the rest from the states
+NET_LAYOUT = {
+    "aliens": 2,  # x, y
+    "effects": 5,  # Center x, y, size, frame
+    "bullets": 5,  # x, y, image, angle, dying
+    "players": 7,  # x, y, tilt, opacity, health, dash fuel, dashing
+}
+POSITION_SCALE = 4  # Positions go over the wire in quarter pixels
+TILT_SCALE = 256
+FUEL_SCALE = 64
+tick_interval = 1  # Steps between world states sent
+
+
+def world_state(snapshot: Snapshot) -> WorldState:
+    """The snapshot as it goes over the wire, plus what clients need to predict their player."""
+    alien_sprites, effect_sprites, bullet_sprites, _ = snapshot.sprites
+    alien_ids = alien_sprites.ids.astype(np.uint16)
+    effect_ids = effect_sprites.ids.astype(int)
+    bullet_ids = bullet_sprites.ids.astype(int)
+    effect_sizes = np.array([explosions.sizes[animation] for animation in explosions.animation[effect_ids].tolist()]).reshape(-1, 2)
+    effect_frames = np.minimum(explosions.frames(game_clock.now)[effect_ids], FRAME_COUNT - 1)
+    players = active_players()
+    return WorldState(
+        frame,
+        np.array([dt, game_clock.now, bg_x1, bg_x2, shift_x, shift_y], dtype=np.float32),
+        {
+            "aliens": (alien_ids, quantize(np.column_stack([alien_sprites.x, alien_sprites.y]), POSITION_SCALE)),
+            "effects": (effect_ids.astype(np.uint16), np.column_stack([quantize(np.column_stack([explosions.x[effect_ids], explosions.y[effect_ids]]), POSITION_SCALE), quantize(effect_sizes), quantize(effect_frames)])),
+            "bullets": (bullet_ids.astype(np.uint16), np.column_stack([quantize(np.column_stack([bullet_sprites.x, bullet_sprites.y]), POSITION_SCALE), quantize(bullets.image[bullet_ids]), quantize(bullet_sprites.angle % 360), quantize(~np.isnan(bullet_sprites.alpha))])),
+            "players": (
+                np.arange(len(players), dtype=np.uint16),
+                np.array([[*quantize([being.rect.x, being.rect.y], POSITION_SCALE), quantize(being.tilt, TILT_SCALE), quantize(being.opacity), quantize(being.health), quantize(being.dash_fuel, FUEL_SCALE), being.dashing] for being in players], dtype=np.int16).reshape(-1, NET_LAYOUT["players"]),
+            ),
+        },
+    )
+
+
+# Simulation
+frame = 0
+dt = 0.0
+frame_difficulty = 0.0
+shift_x = 0.0
+shift_y = 0.0
+game_clock = GameClock(seconds_per_dt=1 / 36)  # dt is 1 per 1/36 s at the starting speed_difficulty
+fixed_step = None
 
-    if player.health > 0:
+
+def control_player(being: Player, controls: dict[str, bool], shoot: bool = True) -> tuple[float, float]:
+    """Move a player by its controls and returns how far that shifts the world, only the host's player gets to shift it.
+
+    Clients run it on their own player without shooting to predict it, the server's bullets are the only ones."""
+    shift_x = 0.0
+    shift_y = 0.0
+    if being.health > 0:
         base_move_by = 7.5 * dt
         move_by = base_move_by
-        if player.dashing:
+        if being.dashing:
             # Make controls faster and sticky
-            controls |= {key: value for key, value in last_controls.items() if key == "left" and "right" not in controls or key == "right" and "left" not in controls or key == "up" and "down" not in controls or key == "down" and "up" not in controls}
-            move_by = base_move_by + 1 + 4 * player.dash_fuel / player.dash_fuel_capacity
+            controls |= {key: value for key, value in being.last_controls.items() if key == "left" and "right" not in controls or key == "right" and "left" not in controls or key == "up" and "down" not in controls or key == "down" and "up" not in controls}
+            move_by = base_move_by + 1 + 4 * being.dash_fuel / being.dash_fuel_capacity
 
         if ("left" in controls or "right" in controls) and ("up" in controls or "down" in controls):
             move_by /= sqrt(2)
 
         if "left" in controls:
-            player.rect.x -= move_by
+            being.rect.x -= move_by
             shift_x -= 0.1 * move_by / 2
 
         if "right" in controls:
-            player.rect.x += move_by
+            being.rect.x += move_by
             shift_x += 0.5 * move_by / 2
 
         if "up" in controls:
-            player.rect.y -= move_by
+            being.rect.y -= move_by
             shift_y += 1.0 * move_by / 2
 
         if "down" in controls:
-            player.rect.y += move_by
+            being.rect.y += move_by
             shift_y -= 1.0 * move_by / 2
 
-        if player.dashing:
+        if being.dashing:
             shift_y *= 2
 
-        if "dash" in controls and player.dash_fuel > 10:
-            player.dashing = True
+        if "dash" in controls and being.dash_fuel > 10:
+            being.dashing = True
         if "dash" not in controls:
-            player.dashing = False
-            if "shoot" in controls:
-                player.shoot()
+            being.dashing = False
+            if "shoot" in controls and shoot:
+                being.shoot(aim=-shift_y * 0.1)
 
         shift_x *= dt
         shift_y *= dt
-    last_controls = controls.copy()
+    being.tilt = shift_y
+    being.last_controls = controls.copy()
+    return shift_x, shift_y
 
-    # Clear screen
-    screen.fill((0, 0, 0))
+
+def simulate(controls: dict[str, bool]) -> Optional[Snapshot]:
+    """Advance the game by one fixed step and snapshot it, None once it's over. Headless runs and replays bring their own controls."""
+    global frame, dt, frame_difficulty, shift_x, shift_y, live_aliens
+    if args.frames is not None and frame >= args.frames or replay is not None and frame >= len(replay):
+        return None
+    frame += 1
+
+    # Two difficulty factors here - it gets faster, and they shoot a bit more
+    speed_difficulty = 36 + frame * 0.00025
+    expected_dt = 1000 / (speed_difficulty)
+    if replay is not None:
+        dt, controls = replay.frame(frame - 1)
+    else:
+        dt = fixed_step.step_ms / expected_dt
+        if args.headless:
+            controls = scripted_controls(frame)
+    if recorder is not None:
+        recorder.record(dt, controls)
+    game_clock.tick(dt)
+
+    frame_difficulty = (0.0010 + frame * 0.0000001) * dt * args.fire_rate
+    if frame % 300 == 0:
+        print("Difficulty", frame_difficulty, speed_difficulty)
+        print("FPS:", clock.get_fps())
+        print(bullets.stats())
+        print(transform_cache.stats())
+        print(renderer.stats())
+        print(render_queue.stats())
+        print(explosions.stats())
+        print(fixed_step.stats())
+        if server is not None:
+            print(server.stats())
+        for pool in alien_pools.values():
+            print(pool.stats())
+        if swarm.grid.debug:
+            print(swarm.grid.stats())
+            swarm.grid.reset_stats()
+    # Process controls
+    shift_x, shift_y = control_player(player, controls)
+    if server is not None:
+        wingman_controls = server.controls(1)
+        if wingman_controls is not None:
+            control_player(wingman, wingman_controls)
+    sim_profiler.mark("controls")
 
     # Background
     update_background()
-    screen.blit(bg_image, (round(bg_x1), 0))
-    screen.blit(bg_image, (round(bg_x2), 0))
+    sim_profiler.mark("background")
 
     # Stars
     for star_layer in star_layers:
         star_layer.update(shift_x, shift_y)
-        star_layer.draw()
+    sim_profiler.mark("stars")
 
     # Aliens
-    for alien in aliens:
-        alien.update(shift_x, shift_y)
+    spawn_waves()
+    for index in swarm.update(dt, shift_x, shift_y, player.rect.x, player.rect.y, SCREEN_WIDTH, SCREEN_HEIGHT).tolist():
+        alien_pools[aliens[index].kind].release(index)
+    live_aliens = swarm.live_aliens()
+    for alien in live_aliens:
         if alien.can_shoot():
             if alien.targeting_style == "random" and random.random() * random.random() < frame_difficulty:
                 alien.shoot()
@@ -608,37 +886,318 @@ while True:
                 alien.shoot()
             if alien.targeting_style == "random_hit" and random.random() * random.random() < frame_difficulty * ((alien.original_health - alien.health) * 2 + 1):
                 alien.shoot()
-            if alien.targeting_style == "mirror" and random.random() * random.random() < frame_difficulty * 6 and datetime.now() - player.shot_freq * 3 < player.last_shot and alien.rect.x < SCREEN_WIDTH:
+            if alien.targeting_style == "mirror" and random.random() * random.random() < frame_difficulty * 6 and player.shot_cooldown.within(game_clock.now, 3) and alien.rect.x < SCREEN_WIDTH:
                 alien.shoot()
-        screen.blit(alien.image, alien.rect.to_rect())
+    sim_profiler.mark("aliens")
 
     # Bullets
-    # Warm up the rotate cache, lol
-    bullet_angle_step = 4
-    if frame == 1:
-        for angle in range(0, 360 + bullet_angle_step, bullet_angle_step):
-            rotate_image(alien_bullet_image, None, angle)
-            rotate_image(alien_bullet_big_left_image, None, angle)
-            rotate_image(alien_bullet_big_right_image, None, angle)
-    for bullet in bullets:
-        bullet.update(shift_x, shift_y)
-
-        if bullet.active:
-            if bullet.target_type == "Player":
-                img, _ = rotate_image(bullet.image, None, round(360 * random.random()) // bullet_angle_step * bullet_angle_step)
-            else:
-                img = bullet.image
-            img.set_alpha(255)
-            screen.blit(img, bullet.rect.to_rect())
-        else:
-            img = bullet.image
-            img.set_alpha(127)
-            screen.blit(img, bullet.rect.to_rect())
-
-    bullets = [b for b in bullets if b.active]
+    update_bullets(shift_x, shift_y)
+    sim_profiler.mark("bullets")
 
     # Player
-    player.update()
-    screen.blit(*rotate_image(player.image, player.rect, round(shift_y * 1.5), player.opacity))
+    for being in active_players():
+        being.update()
+    sim_profiler.mark("player")
+
+    # Effects
+    explosions.update(dt, shift_x, shift_y, game_clock.now)
+    sim_profiler.mark("effects")
+
+    snapshot = take_snapshot()
+    bullets.release_dying()
+    sim_profiler.mark("snapshot")
+
+    if server is not None and frame % tick_interval == 0:
+        server.send(world_state(snapshot))
+        sim_profiler.mark("net")
+
+    if memory_monitor is not None and frame % args.memory == 0:
+        print(memory_monitor.format(memory_monitor.sample(frame)))
+        sim_profiler.mark("memory")
+    return snapshot
+
+
+def take_snapshot() -> Snapshot:
+    # Dead ones are hidden, their explosions take over
+    alive = [alien.health > 0 for alien in live_aliens]
+    shown = swarm.live[alive]
+    players = active_players()
+    players_shown = [slot for slot, being in enumerate(players) if being.health > 0]
+    effect_ids, effect_images, effect_x, effect_y = explosions.sprites(game_clock.now)
+    visible = bullets.visible()
+    bullet_angle = np.zeros(len(visible))
+    spinning = np.flatnonzero(bullets.active[visible] & (bullets.target[visible] == 1))
+    bullet_angle[spinning] = [360 * random.random() for _ in range(len(spinning))]
+    return Snapshot(
+        frame=frame,
+        time=perf_counter(),
+        background=(bg_x1, bg_x2),
+        stars=tuple(frozen(star_layer.stars) for star_layer in star_layers),
+        sprites=(
+            Sprites("aliens", frozen(shown), tuple(aliens[i].image for i in shown.tolist()), frozen(swarm.x[shown]), frozen(swarm.y[shown]), frozen(np.zeros(len(shown))), frozen(np.full(len(shown), np.nan))),
+            Sprites("effects", frozen(effect_ids), tuple(effect_images), frozen(effect_x), frozen(effect_y), frozen(np.zeros(len(effect_ids))), frozen(np.full(len(effect_ids), np.nan))),
+            Sprites("bullets", frozen(visible), tuple(bullets.images[i] for i in bullets.image[visible].tolist()), frozen(bullets.x[visible]), frozen(bullets.y[visible]), frozen(bullet_angle), frozen(np.where(bullets.dying[visible], 127, np.nan)), sprite_class="bullet"),
+            Sprites(
+                "player",
+                frozen(players_shown),
+                tuple(players[slot].image for slot in players_shown),
+                frozen([players[slot].rect.centerx for slot in players_shown]),
+                frozen([players[slot].rect.centery for slot in players_shown]),
+                frozen([players[slot].angle for slot in players_shown]),
+                frozen([players[slot].opacity for slot in players_shown]),
+                sprite_class="ship",
+                centered=True,
+            ),
+        ),
+    )
+
 
-    pg.display.flip()
+# Drawing, only from snapshots so it can run alongside the simulation
+def queue_sprites(sprites: Sprites, previous: Optional[Sprites], t: float):
+    xs, ys = sprites.positions(previous, t)
+    render_queue.extend(sprites.name, sprites.images, xs, ys, sprites.angle, sprites.alpha, sprites.sprite_class, sprites.centered)
+
+
+def draw(previous: Optional[Snapshot], current: Snapshot, t: float):
+    """Draw current, or t of the way from previous to current."""
+    if t >= 1:
+        previous = None
+    if profiler.overlay:
+        renderer.invalidate()
+
+    if previous is None:
+        renderer.draw_background(*current.background)
+    else:
+        renderer.draw_background(*(float(blend(a, b, t, bg_image.get_width() / 2)) for a, b in zip(previous.background, current.background)))
+    profiler.mark("draw_background")
+
+    for star_layer, stars, previous_stars in zip(star_layers, current.stars, previous.stars if previous else current.stars):
+        star_layer.draw(stars if previous is None else blend(previous_stars, stars, t))
+    profiler.mark("draw_stars")
+
+    for sprites, previous_sprites in zip(current.sprites, previous.sprites if previous else repeat(None)):
+        queue_sprites(sprites, previous_sprites, t)
+    profiler.mark("queue")
+    render_queue.submit(renderer, profiler.mark)
+
+    if profiler.overlay:
+        profiler.draw_overlay(screen)
+        profiler.mark("profiler")
+
+    renderer.present()
+    profiler.mark("flip")
+
+
+# Co-op client, draws the server's world states a little in the past and its own player ahead of them
+timeline = None
+pending_inputs = deque()  # [sequence, controls, predicted x, predicted y] of the inputs the server hasn't applied yet
+prediction_errors = []  # Pixels between where the player was predicted and where the server put it
+
+
+def client_snapshot(state: WorldState) -> Snapshot:
+    """A world state from the server as something draw() takes, without the player on this side, that one's predicted."""
+    alien_ids, alien_values = state.categories["aliens"]
+    effect_ids, effect_values = state.categories["effects"]
+    bullet_ids, bullet_values = state.categories["bullets"]
+    player_ids, player_values = state.categories["players"]
+    effect_images = [explosions.animations[explosions.bake((width, height))][effect_frame] for width, height, effect_frame in effect_values[:, 2:].tolist()]
+    effect_x = effect_values[:, 0] / POSITION_SCALE - np.array([image.get_width() / 2 for image in effect_images])
+    effect_y = effect_values[:, 1] / POSITION_SCALE - np.array([image.get_height() / 2 for image in effect_images])
+    others = [i for i, slot in enumerate(player_ids.tolist()) if slot != player_slot and player_values[i, 4] > 0]
+    others_x = player_values[others, 0] / POSITION_SCALE + player.rect.width / 2
+    others_y = player_values[others, 1] / POSITION_SCALE + player.rect.height / 2
+    return Snapshot(
+        frame=state.tick,
+        time=perf_counter(),
+        background=tuple(state.world[2:4].tolist()),
+        stars=(),
+        sprites=(
+            Sprites("aliens", frozen(alien_ids), tuple(aliens[i].image for i in alien_ids.tolist()), frozen(alien_values[:, 0] / POSITION_SCALE), frozen(alien_values[:, 1] / POSITION_SCALE), frozen(np.zeros(len(alien_ids))), frozen(np.full(len(alien_ids), np.nan))),
+            Sprites("effects", frozen(effect_ids), tuple(effect_images), frozen(effect_x), frozen(effect_y), frozen(np.zeros(len(effect_ids))), frozen(np.full(len(effect_ids), np.nan))),
+            Sprites("bullets", frozen(bullet_ids), tuple(bullets.images[i] for i in bullet_values[:, 2].tolist()), frozen(bullet_values[:, 0] / POSITION_SCALE), frozen(bullet_values[:, 1] / POSITION_SCALE), frozen(bullet_values[:, 3]), frozen(np.where(bullet_values[:, 4], 127, np.nan)), sprite_class="bullet"),
+            Sprites("player", frozen(player_ids[others]), (player.image,) * len(others), frozen(others_x), frozen(others_y), frozen(player_values[others, 2] / TILT_SCALE * 1.5), frozen(player_values[others, 3]), sprite_class="ship", centered=True),
+        ),
+    )
+
+
+def predict(controls: dict[str, bool]):
+    """One step of this side's player, the same way the server will run it."""
+    control_player(wingman, dict(controls), shoot=False)
+    wingman.update()
+
+
+def reconcile(state: WorldState, applied: int):
+    """Put this side's player where the server had it after input `applied`, then replay the inputs it hasn't applied yet on top."""
+    ids, values = state.categories["players"]
+    mine = np.flatnonzero(ids == player_slot)
+    if not mine.size:
+        return
+    x, y, tilt, opacity, health, fuel, dashing = values[mine[0]].tolist()
+    while pending_inputs and pending_inputs[0][0] < applied:
+        pending_inputs.popleft()
+    if pending_inputs and pending_inputs[0][0] == applied:
+        _, controls, predicted_x, predicted_y = pending_inputs.popleft()
+        prediction_errors.append(hypot(predicted_x - x / POSITION_SCALE, predicted_y - y / POSITION_SCALE))
+        wingman.last_controls = controls
+    wingman.rect.x, wingman.rect.y = x / POSITION_SCALE, y / POSITION_SCALE
+    wingman.tilt, wingman.opacity, wingman.health = tilt / TILT_SCALE, opacity, health
+    wingman.dash_fuel, wingman.dashing = fuel / FUEL_SCALE, bool(dashing)
+    for pending in pending_inputs:
+        predict(pending[1])
+        pending[2], pending[3] = wingman.rect.x, wingman.rect.y
+
+
+def prediction_summary() -> dict:
+    errors = np.array(prediction_errors or [0.0])
+    return {"mean": float(errors.mean()), "p99": float(np.percentile(errors, 99)), "max": float(errors.max())}
+
+
+def predicted_sprites() -> Sprites:
+    shown = slice(0, int(wingman.health > 0))
+    return Sprites("player", frozen([player_slot][shown]), (wingman.image,)[shown], frozen([wingman.rect.centerx][shown]), frozen([wingman.rect.centery][shown]), frozen([wingman.angle][shown]), frozen([wingman.opacity][shown]), sprite_class="ship", centered=True)
+
+
+def run_client():
+    """The client's game loop: send inputs and predict this side's player every step, draw everything else from the server's states."""
+    global timeline, frame, dt
+    timeline = Timeline(delay=2 * net_client.tick_interval)
+    world_shift = (0.0, 0.0)
+    while True:
+        clock.tick(args.step_rate if args.headless else 60)
+        profiler.begin_frame()
+        controls = poll_input()
+        if net_client.closed or args.frames is not None and frame >= args.frames:
+            quit_game()
+        profiler.mark("controls")
+
+        for state, applied in net_client.receive():
+            dt = float(state.world[0])
+            world_shift = tuple(state.world[4:6].tolist())
+            timeline.add(client_snapshot(state))
+            reconcile(state, applied)
+        profiler.mark("net")
+        if not net_client.received:  # Nothing to predict from yet, not even dt
+            profiler.end_frame(frame)
+            continue
+
+        steps = 1 if args.headless else fixed_step.advance(clock.get_time())
+        for _ in range(steps):
+            frame += 1
+            if args.headless:
+                controls = scripted_controls(frame + 120)  # Out of step with the host's script
+            predict(controls)
+            pending_inputs.append([net_client.send_input(controls), dict(controls), wingman.rect.x, wingman.rect.y])
+            for star_layer in star_layers:
+                star_layer.update(*world_shift)
+        profiler.mark("predict")
+
+        previous, current, t = timeline.advance(steps if args.headless else clock.get_time() / fixed_step.step_ms)
+        if current is None:
+            profiler.end_frame(frame)
+            continue
+        stars = tuple(frozen(star_layer.stars) for star_layer in star_layers)
+        mine = predicted_sprites()
+        previous = previous and replace(previous, stars=stars, sprites=(*previous.sprites, mine))
+        draw(previous, replace(current, stars=stars, sprites=(*current.sprites, mine)), t)
+        profiler.end_frame(frame)
+        if frame % 300 == 0:
+            print(net_client.stats())
+            print(f"Prediction: {prediction_summary()}, interpolation {timeline.underruns} underruns, {timeline.jumps} jumps")
+        if "first_frame" not in startup.steps:
+            startup.mark("first_frame")
+            print(startup.format(atlas))
+
+
+clock = None
+sim_thread = None
+
+
+def run():
+    """The game loop, until quit_game()."""
+    global clock, sim_thread
+    clock = pg.time.Clock()
+    if args.sim == "threaded":
+
+        def simulation_step(controls: dict[str, bool]) -> Optional[Snapshot]:
+            sim_profiler.begin_frame()
+            snapshot = simulate(controls)
+            sim_profiler.end_frame(frame)
+            return snapshot
+
+        sim_thread = SimulationThread(simulation_step, rate=None if args.headless else args.step_rate, max_catch_up=args.max_substeps)
+        sim_thread.start()
+
+    if net_client is not None:
+        run_client()
+    if server is not None and args.headless:
+        server.wait_for_clients(timeout=10)  # Nobody's watching, so give the whole run to the test
+
+    # Game loop
+    drawn = 0
+    previous = snapshot = None
+    while True:
+        if server is not None and args.headless:
+            clock.tick(args.step_rate)  # Still one step per frame, but the client plays in real time
+        elif args.headless or args.unthrottled:
+            clock.tick()
+        else:
+            clock.tick(60)
+        profiler.begin_frame()
+        controls = poll_input()
+        if server is not None:
+            profiler.mark("controls")
+            server.poll()
+            profiler.mark("net")
+
+        if sim_thread is None:
+            # Headless runs and replays take one step per frame, so they play out the same at any speed
+            fixed = args.headless or replay is not None
+            for _ in range(1 if fixed else fixed_step.advance(clock.get_time())):
+                previous, snapshot = snapshot, simulate(controls)
+                if snapshot is None:
+                    quit_game()
+            if snapshot is None:
+                continue
+            t = 1.0 if fixed else fixed_step.alpha
+        else:
+            sim_thread.post(controls)
+            if args.headless:
+                sim_thread.buffer.wait(drawn, timeout=0.1)  # Nothing to watch, so draw each snapshot once instead of spinning
+            if sim_thread.finished:
+                if sim_thread.error is not None:
+                    raise sim_thread.error
+                quit_game()
+            previous, snapshot = sim_thread.buffer.read()
+            if snapshot is None:
+                continue
+            t = blend_factor(previous, snapshot, perf_counter())
+            drawn = snapshot.frame
+            profiler.mark("controls")
+
+        draw(previous, snapshot, t)
+        profiler.end_frame(snapshot.frame)
+        if "first_frame" not in startup.steps:
+            startup.mark("first_frame")
+            print(startup.format(atlas))
+
+
+def main(argv: list[str] | None = None):
+    global startup
+    startup = StartupTimer(process_started())
+    startup.mark("import")
+    parse_args(argv)
+    init_display()
+    startup.mark("pg_init")
+    draw_loading("Loading sprites", 0.2)
+    load_assets()
+    startup.mark("assets")
+    draw_loading("Building the world", 0.6)
+    build_world(args.cull_margin)
+    set_up_tools()
+    startup.mark("world")
+    draw_loading("Starting", 1.0)
+    run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+import threading
+from dataclasses import dataclass, field
+from time import perf_counter, sleep
+from typing import Callable
+
+import numpy as np
+from pygame import Surface
+
+MAX_BLEND_JUMP = 200  # Moved further than this between snapshots means respawned or wrapped around, don't slide it across the screen
+
+
+def frozen(array) -> np.ndarray:
+    array = np.array(array, dtype=float)
+    array.setflags(write=False)
+    return array
+
+
+def blend(previous: np.ndarray, current: np.ndarray, t: float, max_jump: float = MAX_BLEND_JUMP) -> np.ndarray:
+    """Positions t of the way from previous to current, except those that jumped."""
+    step = current - previous
+    return np.where(np.abs(step) > max_jump, current, previous + step * t)
+
+
+@dataclass(frozen=True)
+class Sprites:
+    """Drawables of one kind. Images are shared references that the simulation doesn't mutate anymore, the rest are read-only arrays.
+
+    alpha is NaN where the image is drawn as is, ids match the same sprite between snapshots."""
+
+    name: str
+    ids: np.ndarray
+    images: tuple[Surface, ...]
+    x: np.ndarray
+    y: np.ndarray
+    angle: np.ndarray
+    alpha: np.ndarray
+    sprite_class: str = ""
+    centered: bool = False  # x and y are the center instead of the top left
+
+    def positions(self, previous: "Sprites | None", t: float) -> tuple[np.ndarray, np.ndarray]:
+        if previous is None or t >= 1:
+            return self.x, self.y
+        x = self.x.copy()
+        y = self.y.copy()
+        _, mine, theirs = np.intersect1d(self.ids, previous.ids, assume_unique=True, return_indices=True)
+        x[mine] = blend(previous.x[theirs], self.x[mine], t)
+        y[mine] = blend(previous.y[theirs], self.y[mine], t)
+        return x, y
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    """Everything the renderer needs for one simulated frame, safe to draw while the next one is simulated."""
+
+    frame: int
+    time: float  # perf_counter() when it was taken
+    background: tuple[float, float]
+    stars: tuple[np.ndarray, ...]
+    sprites: tuple[Sprites, ...]  # In drawing order
+
+
+def blend_factor(previous: Snapshot | None, current: Snapshot, now: float) -> float:
+    """How far to blend from previous to current, drawing one simulation step behind so there's always something to blend towards."""
+    if previous is None or current.time <= previous.time:
+        return 1.0
+    return min(max((now - current.time) / (current.time - previous.time), 0.0), 1.0)
+
+
+@dataclass
+class Timeline:
+    """Snapshots that came in from a server, drawn delay frames behind the newest so there's still one to blend towards when a packet is late or lost.
+
+    The playhead runs a little fast or slow to stay delay behind, and jumps when it's way off, like after a stall."""
+
+    delay: float  # Frames
+    keep: int = 8
+    snapshots: list[Snapshot] = field(default_factory=list)
+    playhead: float | None = None
+
+    # Stats
+    underruns: int = 0  # Frames the playhead caught up with the newest snapshot, nothing to blend towards
+    jumps: int = 0
+
+    def add(self, snapshot: Snapshot):
+        self.snapshots.append(snapshot)
+        del self.snapshots[: -self.keep]
+
+    def advance(self, frames: float) -> tuple[Snapshot | None, Snapshot | None, float]:
+        """Move the playhead on by frames, returns the snapshots around it and how far between them it is, for draw()."""
+        if not self.snapshots:
+            return None, None, 1.0
+        newest = self.snapshots[-1].frame
+        target = newest - self.delay
+        if self.playhead is None or abs(self.playhead - target) > self.delay * 2:
+            self.jumps += self.playhead is not None
+            self.playhead = target
+        else:
+            self.playhead += frames * (1.05 if self.playhead < target - 1 else 0.95 if self.playhead > target + 1 else 1)
+        if self.playhead >= newest:
+            self.playhead = newest
+            self.underruns += 1
+        for previous, current in zip(self.snapshots, self.snapshots[1:]):
+            if previous.frame <= self.playhead <= current.frame:
+                return previous, current, (self.playhead - previous.frame) / (current.frame - previous.frame)
+        return None, self.snapshots[0 if self.playhead < self.snapshots[0].frame else -1], 1.0
+
+
+@dataclass
+class SnapshotBuffer:
+    """Double buffer of the two newest snapshots, the simulation publishes and the renderer reads both to blend between them."""
+
+    previous: Snapshot | None = None
+    current: Snapshot | None = None
+    published: int = 0
+
+    def __post_init__(self):
+        self.lock = threading.Condition()
+
+    def publish(self, snapshot: Snapshot):
+        with self.lock:
+            self.previous, self.current = self.current, snapshot
+            self.published += 1
+            self.lock.notify_all()
+
+    def read(self) -> tuple[Snapshot | None, Snapshot | None]:
+        with self.lock:
+            return self.previous, self.current
+
+    def wait(self, after_frame: int, timeout: float | None = None):
+        """Block until a snapshot newer than after_frame is published, or the timeout passes."""
+        with self.lock:
+            self.lock.wait_for(lambda: self.current is not None and self.current.frame > after_frame, timeout)
+
+
+@dataclass
+class SimulationThread:
+    """Runs step() on a worker thread and publishes the snapshots it returns, until it returns None.
+
+    NumPy and SDL blits release the GIL in their heavy parts, so simulating the next frame overlaps with drawing this one."""
+
+    step: Callable[[dict[str, bool]], Snapshot | None]
+    buffer: SnapshotBuffer = field(default_factory=SnapshotBuffer)
+    rate: float | None = 60  # Steps per second, None for as fast as possible
+    max_catch_up: int = 5  # Steps run back to back when behind, before the lost time is given up on
+    error: BaseException | None = None
+
+    def __post_init__(self):
+        self.thread = threading.Thread(target=self.run, name="simulation", daemon=True)
+        self.stopping = threading.Event()
+        self.controls_lock = threading.Lock()
+        self.latest_controls = {}
+        self.posted_controls = {}
+
+    def start(self):
+        self.thread.start()
+
+    def post(self, controls: dict[str, bool]):
+        """Hand over the controls polled by the main thread, presses are kept until a step has seen them."""
+        with self.controls_lock:
+            self.latest_controls = controls
+            self.posted_controls |= controls
+
+    def take_controls(self) -> dict[str, bool]:
+        with self.controls_lock:
+            controls = self.posted_controls or dict(self.latest_controls)
+            self.posted_controls = {}
+            return controls
+
+    def run(self):
+        next_step = perf_counter()
+        try:
+            while not self.stopping.is_set():
+                snapshot = self.step(self.take_controls())
+                if snapshot is None:
+                    break
+                self.buffer.publish(snapshot)
+                if self.rate:
+                    next_step += 1 / self.rate
+                    delay = next_step - perf_counter()
+                    if delay > 0:
+                        sleep(delay)
+                    elif -delay > self.max_catch_up / self.rate:
+                        next_step = perf_counter()  # Too far behind, the game slows down instead
+        except BaseException as error:
+            self.error = error
+
+    @property
+    def finished(self) -> bool:
+        return not self.thread.is_alive()
+
+    def stop(self):
+        self.stopping.set()
+        if self.thread.is_alive():
+            self.thread.join()
@@ -0,0 +1,47 @@
+"""Soak test: runs smup.py headless for a long session with memory tracking, and fails if memory goes over a ceiling.
+
+python src/soak.py --frames 100000 --ceiling-mb 128
+python src/soak.py --frames 20000 -- --aliens 100,40,30,10
+"""
+
+import argparse
+import sys
+
+from bench import run_smup
+from memory import megabytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--frames", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--interval", type=int, default=1000, help="frames between memory samples")
+    parser.add_argument("--ceiling-mb", type=float, default=128, help="limit for the Python heap plus surface pixels")
+    parser.add_argument("--rss-ceiling-mb", type=float, help="also limit the process' peak resident set size")
+    parser.add_argument("smup_args", nargs="*", help="passed on to smup.py, after --")
+    args = parser.parse_args()
+
+    report = run_smup(["--memory", str(args.interval), *args.smup_args], args.frames, args.seed)
+    memory = report["memory"]
+    for name, size in memory["peak_bytes"].items():
+        print(f"{name:<16} peak {megabytes(size):>10}")
+    rss = memory["last"]["max_rss"]
+    if rss is not None:
+        print(f"{'max RSS':<16} peak {megabytes(rss):>10}")
+    if memory["growing"]:
+        print(f"Still growing at the end: {', '.join(memory['growing'])}")
+
+    failures = []
+    if memory["peak_total"] > args.ceiling_mb * 1024 * 1024:
+        failures.append(f"Python heap plus surfaces peaked at {megabytes(memory['peak_total'])}, over the {args.ceiling_mb:g} MB ceiling")
+    if args.rss_ceiling_mb is not None and rss is not None and rss > args.rss_ceiling_mb * 1024 * 1024:
+        failures.append(f"max RSS {megabytes(rss)} is over the {args.rss_ceiling_mb:g} MB ceiling")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if failures:
+        sys.exit(1)
+    print(f"OK: {args.frames} frames, peak {megabytes(memory['peak_total'])} of {args.ceiling_mb:g} MB")
+
+
+if __name__ == "__main__":
+    main()
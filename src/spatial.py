@@ -0,0 +1,84 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+CELL_KEY_STRIDE = 1 << 32
+NEIGHBOR_OFFSETS = [dx * CELL_KEY_STRIDE + dy for dx in (-1, 0, 1) for dy in (-1, 0, 1)]
+
+
+@dataclass
+class GridIndex:
+    """Vectorized uniform grid broadphase over arrays of boxes, rebuilt for every query. Serves alien avoidance and the bullet hit test.
+
+    Boxes are binned by center, and cells are at least as big as the largest box plus margin,
+    so anything that can overlap is in the same or a neighboring cell."""
+
+    cell_size: float = 160
+    debug: bool = False
+
+    # Debug counters, reset with reset_stats()
+    queries: int = 0
+    candidate_pairs: int = 0
+    brute_force_pairs: int = 0
+
+    def pairs(self, x: np.ndarray, y: np.ndarray, width: np.ndarray, height: np.ndarray, margin: float = 0) -> tuple[np.ndarray, np.ndarray]:
+        """Candidate pairs (i, j) of boxes that might overlap when inflated by margin, both ways round, never i == j."""
+        count = len(x)
+        if count == 0:
+            return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp)
+        cell_size = max(self.cell_size, width.max() + margin, height.max() + margin)
+        keys = self.keys(x, y, width, height, cell_size)
+        pairs_i, pairs_j = self.neighbors(keys, keys)
+        different = pairs_i != pairs_j
+        pairs_i = pairs_i[different]
+        pairs_j = pairs_j[different]
+
+        if self.debug:
+            self.queries += count
+            self.candidate_pairs += len(pairs_i)
+            self.brute_force_pairs += count * (count - 1)
+        return pairs_i, pairs_j
+
+    def cross_pairs(self, x: np.ndarray, y: np.ndarray, width: np.ndarray, height: np.ndarray, other_x: np.ndarray, other_y: np.ndarray, other_width: np.ndarray, other_height: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Candidate pairs (i, j) of a box from the first set and one from the other that might overlap, e.g. bullets against aliens."""
+        if len(x) == 0 or len(other_x) == 0:
+            return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp)
+        cell_size = max(self.cell_size, width.max(), height.max(), other_width.max(), other_height.max())
+        pairs_i, pairs_j = self.neighbors(self.keys(x, y, width, height, cell_size), self.keys(other_x, other_y, other_width, other_height, cell_size))
+
+        if self.debug:
+            self.queries += len(x)
+            self.candidate_pairs += len(pairs_i)
+            self.brute_force_pairs += len(x) * len(other_x)
+        return pairs_i, pairs_j
+
+    @staticmethod
+    def keys(x: np.ndarray, y: np.ndarray, width: np.ndarray, height: np.ndarray, cell_size: float) -> np.ndarray:
+        return np.floor((x + width / 2) / cell_size).astype(np.int64) * CELL_KEY_STRIDE + np.floor((y + height / 2) / cell_size).astype(np.int64)
+
+    @staticmethod
+    def neighbors(keys: np.ndarray, other_keys: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Pairs (i, j) with other_keys[j] in the same or a neighboring cell as keys[i]."""
+        # Other boxes sorted by cell, each occupied cell is a run in that order
+        order = np.argsort(other_keys, kind="stable")
+        cell_keys, starts, counts = np.unique(other_keys[order], return_index=True, return_counts=True)
+
+        pairs_i = []
+        pairs_j = []
+        for offset in NEIGHBOR_OFFSETS:
+            neighbor_keys = keys + offset
+            cells = np.minimum(np.searchsorted(cell_keys, neighbor_keys), len(cell_keys) - 1)
+            found = np.flatnonzero(cell_keys[cells] == neighbor_keys)
+            run_lengths = counts[cells[found]]
+            run_offsets = np.arange(run_lengths.sum()) - np.repeat(np.cumsum(run_lengths) - run_lengths, run_lengths)
+            pairs_i.append(np.repeat(found, run_lengths))
+            pairs_j.append(order[np.repeat(starts[cells[found]], run_lengths) + run_offsets])
+        return np.concatenate(pairs_i), np.concatenate(pairs_j)
+
+    def reset_stats(self):
+        self.queries = 0
+        self.candidate_pairs = 0
+        self.brute_force_pairs = 0
+
+    def stats(self) -> str:
+        return f"GridIndex: {self.queries} queries, {self.candidate_pairs} candidate pairs (brute force: {self.brute_force_pairs})"
@@ -0,0 +1,101 @@
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from itertools import count
+from weakref import WeakKeyDictionary
+
+import pygame as pg
+from pygame import Surface
+
+
+def surface_bytes(surface: Surface) -> int:
+    return surface.get_pitch() * surface.get_height()
+
+
+@dataclass
+class TransformCache:
+    """LRU cache of rotated and alpha'd sprites, capped by total surface bytes, and of their collision masks.
+
+    Returned surfaces are shared and must not be mutated, each alpha gets its own (quantized) cache entry instead."""
+
+    max_bytes: int = 32 * 1024 * 1024
+    angle_steps: dict[str, int] = field(default_factory=dict)  # Angle quantization per sprite class, default 1
+    alpha_step: int = 8
+    entries: OrderedDict = field(default_factory=OrderedDict)
+    bytes: int = 0
+    masks: dict = field(default_factory=dict)  # Not capped, there's one per sprite and angle at most and they're 1 bit per pixel
+
+    # Stats
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    mask_misses: int = 0
+
+    def __post_init__(self):
+        self.image_ids = WeakKeyDictionary()
+        self.next_id = count()
+        self.id_lock = threading.Lock()  # The renderer and the simulation thread both hand out ids
+
+    def image_id(self, image: Surface) -> int:
+        """Stable key for an image, unlike id() it's never reused for a different surface."""
+        image_id = self.image_ids.get(image)
+        if image_id is None:
+            with self.id_lock:
+                image_id = self.image_ids.get(image)  # Unless the other thread just gave it one
+                if image_id is None:
+                    image_id = self.image_ids[image] = next(self.next_id)
+        return image_id
+
+    def rotate(self, image: Surface, angle: float, opacity: float | None = None, sprite_class: str = "") -> Surface:
+        step = self.angle_steps.get(sprite_class, 1)
+        angle = round(angle / step) * step % 360
+        if opacity is not None:
+            opacity = min(max(round(opacity / self.alpha_step) * self.alpha_step, 0), 255)
+        if angle == 0 and opacity is None:
+            return image
+
+        key = (self.image_id(image), angle, opacity)
+        surface = self.entries.get(key)
+        if surface is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return surface
+
+        self.misses += 1
+        surface = pg.transform.rotate(image, angle)  # Always a new surface, so set_alpha is safe
+        if opacity is not None:
+            surface.set_alpha(opacity)
+        self.store(key, surface)
+        return surface
+
+    def mask(self, image: Surface, angle: float = 0, sprite_class: str = "") -> pg.mask.Mask:
+        """Collision mask of image as rotate() would draw it, made once per image and quantized angle.
+
+        The masks are only used by the simulation, so it rotates on its own instead of going through entries, which the renderer owns.
+        Making one reads image, so with the simulation on its own thread they have to be made up front, before the renderer could be drawing it."""
+        step = self.angle_steps.get(sprite_class, 1)
+        angle = round(angle / step) * step % 360
+        key = (self.image_id(image), angle)
+        mask = self.masks.get(key)
+        if mask is None:
+            self.mask_misses += 1
+            mask = self.masks[key] = pg.mask.from_surface(pg.transform.rotate(image, angle) if angle else image)
+        return mask
+
+    def store(self, key: tuple, surface: Surface):
+        self.entries[key] = surface
+        self.bytes += surface_bytes(surface)
+        while self.bytes > self.max_bytes and len(self.entries) > 1:
+            _, evicted = self.entries.popitem(last=False)
+            self.bytes -= surface_bytes(evicted)
+            self.evictions += 1
+
+    def put(self, image: Surface, angle: float, surface: Surface, sprite_class: str = ""):
+        """Warm the cache with an already rotated surface, e.g. from the asset atlas."""
+        step = self.angle_steps.get(sprite_class, 1)
+        angle = round(angle / step) * step % 360
+        if angle != 0:
+            self.store((self.image_id(image), angle, None), surface)
+
+    def stats(self) -> str:
+        return f"TransformCache: {len(self.entries)} entries, {self.bytes / 1024 / 1024:.1f}/{self.max_bytes / 1024 / 1024:.1f} MB, {self.hits} hits, {self.misses} misses, {self.evictions} evictions, {len(self.masks)} masks ({self.mask_misses} made)"
@@ -0,0 +1,62 @@
+"""Startup benchmark: launches smup.py headless a few times, with a fresh and with a warm atlas cache, and breaks down the time to the first frame.
+
+python src/startup.py --runs 5 --target-ms 600
+python src/startup.py -- --level data/levels/waves.toml
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+from time import perf_counter
+
+from bench import run_smup
+
+STEPS = ["import", "pg_init", "assets", "world", "first_frame", "total"]
+IMAGES = ["decode", "scale", "from_cache"]
+WARM_TARGET_MS = 800  # Warm starts measured 415-630 ms to the first frame, interpreter startup included, so this is a regression check with room for slower machines
+
+
+def measure(cache_path: str, runs: int, seed: int, smup_args: list[str]) -> dict[str, float]:
+    """Median ms of each startup step over the runs, plus the whole process from launch to exit."""
+    samples = []
+    for _ in range(runs):
+        start = perf_counter()
+        report = run_smup(["--asset-cache", cache_path, *smup_args], 1, seed)
+        process = (perf_counter() - start) * 1000
+        startup = report["startup_ms"]
+        samples.append({step: startup[step] for step in STEPS} | {f"image_{name}": startup["images"][name] for name in IMAGES} | {"process": process})
+    return {name: statistics.median(sample[name] for sample in samples) for name in samples[0]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--target-ms", type=float, default=WARM_TARGET_MS, help="limit for the median warm time to the first frame")
+    parser.add_argument("smup_args", nargs="*", help="passed on to smup.py, after --")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache_path = os.path.join(cache_dir, "atlas.pickle")
+        cold = []
+        for _ in range(args.runs):
+            if os.path.exists(cache_path):
+                os.remove(cache_path)
+            cold.append(measure(cache_path, 1, args.seed, args.smup_args))
+        cold = {name: statistics.median(sample[name] for sample in cold) for name in cold[0]}
+        warm = measure(cache_path, args.runs, args.seed, args.smup_args)
+
+    print(f"{'median ms':<16} {'cold':>8} {'warm':>8}")
+    for name in warm:
+        print(f"{name:<16} {cold[name]:8.1f} {warm[name]:8.1f}")
+
+    if warm["total"] > args.target_ms:
+        print(f"FAIL: warm start takes {warm['total']:.0f} ms to the first frame, over the {args.target_ms:g} ms target")
+        sys.exit(1)
+    print(f"OK: warm start takes {warm['total']:.0f} ms to the first frame, {cold['total']:.0f} ms cold, target {args.target_ms:g} ms")
+
+
+if __name__ == "__main__":
+    main()
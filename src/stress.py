@@ -0,0 +1,171 @@
+"""Stress test: scales entity counts along a grid, runs every scenario headless through smup.py, and reports how each phase's frame time grows.
+
+python src/stress.py --frames 600 --csv stress.csv --plot stress.png
+python src/stress.py --axis alien1=1,5,20,50 --axis alien2=1 --axis alien3=1 --axis stars=1 --full
+"""
+
+import argparse
+import csv
+import itertools
+import os
+
+import pygame as pg
+
+from bench import run_smup
+from profiler import FRAME_BUDGET_MS
+
+BASE_ALIENS = {"alien1": 10, "alien2": 4, "alien3": 3}  # Counts in the classic level, each scaled by its own axis
+AXES = {
+    "alien1": [1, 3, 10, 30],  # Multiplier on BASE_ALIENS
+    "alien2": [1, 3, 10, 30],
+    "alien3": [1, 3, 10, 30],
+    "bosses": [1, 4, 16],  # alien4 count
+    "fire_rate": [1, 2, 4, 8],
+    "stars": [1, 4, 16, 32],  # Star count multiplier
+}
+BASELINE = {"alien1": 1, "alien2": 1, "alien3": 1, "bosses": 1, "fire_rate": 1, "stars": 1}
+
+# What each axis is plotted against
+ENTITY_COUNTS = {
+    "alien1": "alien1",
+    "alien2": "alien2",
+    "alien3": "alien3",
+    "bosses": "bosses",
+    "fire_rate": "peak_bullets",
+    "stars": "stars",
+    "grid": "entities",
+}
+
+PLOT_SIZE = (640, 400)
+PLOT_MARGIN = 60
+COLORS = [(230, 25, 75), (60, 180, 75), (255, 225, 25), (0, 130, 200), (245, 130, 48), (145, 30, 180), (70, 240, 240), (240, 50, 230), (210, 245, 60), (250, 190, 212), (0, 128, 128), (220, 190, 255), (170, 110, 40), (255, 250, 200), (128, 0, 0), (170, 255, 195)]
+
+
+def scenarios(axes: dict[str, list[float]], full: bool) -> list[tuple[str, dict]]:
+    """(axis, point) pairs: each axis swept on its own from the baseline, or every combination with full."""
+    if full:
+        return [("grid", dict(zip(axes, values))) for values in itertools.product(*axes.values())]
+    return [(axis, BASELINE | {axis: value}) for axis, values in axes.items() for value in values]
+
+
+def smup_args(point: dict) -> list[str]:
+    aliens = [round(count * point[kind]) for kind, count in BASE_ALIENS.items()] + [round(point["bosses"])]
+    return ["--level", "data/levels/classic.json", "--aliens", ",".join(map(str, aliens)), "--fire-rate", str(point["fire_rate"]), "--stars", str(point["stars"])]
+
+
+def run(axis: str, point: dict, frames: int, seed: int) -> dict:
+    report = run_smup(smup_args(point), frames, seed)
+    row = {"axis": axis} | {f"{name}_setting": value for name, value in point.items()}
+    counts = {kind: report["aliens"].get(kind, 0) for kind in BASE_ALIENS}
+    bosses = report["aliens"].get("alien4", 0)
+    row |= counts
+    row |= {
+        "aliens": sum(counts.values()),  # Without the bosses
+        "bosses": bosses,
+        "stars": report["stars"],
+        "peak_bullets": report["peak_bullets"],
+        "entities": sum(counts.values()) + bosses + report["stars"] + report["peak_bullets"],
+        "frame_p50": report["frame_ms"]["p50"],
+        "frame_p99": report["frame_ms"]["p99"],
+        "over_budget": report["over_budget"] / report["frames"],
+    }
+    return row | {f"{phase}_ms": times["mean"] for phase, times in report["phase_ms"].items()}
+
+
+def plot(rows: list[dict], phases: list[str], path: str):
+    """One panel per swept axis, mean ms of every phase and p99 frame time against entity count, drawn with pygame."""
+    pg.font.init()
+    font = pg.font.Font(None, 20)
+    axes = list(dict.fromkeys(row["axis"] for row in rows))
+    columns = 2
+    panel_width, panel_height = PLOT_SIZE
+    legend_height = 24 * ceil_div(len(phases) + 1, 4)
+    surface = pg.Surface((panel_width * columns, panel_height * ceil_div(len(axes), columns) + legend_height))
+    surface.fill((255, 255, 255))
+    series = [("frame_p99", (0, 0, 0))] + [(phase, COLORS[i % len(COLORS)]) for i, phase in enumerate(phases)]
+
+    for panel, axis in enumerate(axes):
+        left = panel % columns * panel_width + PLOT_MARGIN
+        top = panel // columns * panel_height + PLOT_MARGIN / 2
+        width = panel_width - PLOT_MARGIN * 1.5
+        height = panel_height - PLOT_MARGIN * 1.5
+        points = sorted((row for row in rows if row["axis"] == axis), key=lambda row: row[ENTITY_COUNTS[axis]])
+        counts = [row[ENTITY_COUNTS[axis]] for row in points]
+        max_count = max(max(counts), 1)
+        max_ms = max(max(row[name] for row in points for name, _ in series if name in row), FRAME_BUDGET_MS) * 1.1
+
+        def to_screen(count, ms):
+            return (left + count / max_count * width, top + height - ms / max_ms * height)
+
+        pg.draw.rect(surface, (0, 0, 0), (left, top, width, height), 1)
+        pg.draw.line(surface, (200, 200, 200), to_screen(0, FRAME_BUDGET_MS), to_screen(max_count, FRAME_BUDGET_MS))
+        for name, color in series:
+            line = [to_screen(row[ENTITY_COUNTS[axis]], row.get(name, 0)) for row in points]
+            if len(line) > 1:
+                pg.draw.lines(surface, color, False, line, 2)
+            for position in line:
+                pg.draw.circle(surface, color, position, 3)
+
+        surface.blit(font.render(f"{axis}: ms per frame vs {ENTITY_COUNTS[axis]}", True, (0, 0, 0)), (left, top - 18))
+        surface.blit(font.render(f"{max_ms:.1f}", True, (0, 0, 0)), (left - 40, top))
+        surface.blit(font.render("0", True, (0, 0, 0)), (left - 15, top + height - 10))
+        surface.blit(font.render(f"{FRAME_BUDGET_MS:.1f} budget", True, (150, 150, 150)), (left + 5, to_screen(0, FRAME_BUDGET_MS)[1] - 16))
+        for count in counts:
+            surface.blit(font.render(str(count), True, (0, 0, 0)), (to_screen(count, 0)[0] - 8, top + height + 4))
+
+    legend_top = surface.get_height() - legend_height
+    for i, (name, color) in enumerate(series):
+        x = 20 + i % 4 * (surface.get_width() - 40) / 4
+        y = legend_top + i // 4 * 24 + 4
+        pg.draw.rect(surface, color, (x, y + 4, 14, 8))
+        surface.blit(font.render(name, True, (0, 0, 0)), (x + 20, y))
+    pg.image.save(surface, path)
+
+
+def ceil_div(a: int, b: int) -> int:
+    return -(-a // b)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--frames", type=int, default=600)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--axis", action="append", default=[], help="NAME=V1,V2,... to replace an axis' values (alien1, alien2, alien3, bosses, fire_rate, stars)")
+    parser.add_argument("--full", action="store_true", help="run every combination instead of sweeping one axis at a time")
+    parser.add_argument("--csv", default="stress.csv")
+    parser.add_argument("--plot", default="stress.png")
+    args = parser.parse_args()
+
+    axes = dict(AXES)
+    for spec in args.axis:
+        name, values = spec.split("=")
+        if name not in AXES:
+            parser.error(f"unknown axis {name}, expected one of {', '.join(AXES)}")
+        axes[name] = [float(value) for value in values.split(",")]
+
+    rows = []
+    for axis, point in scenarios(axes, args.full):
+        row = run(axis, point, args.frames, args.seed)
+        rows.append(row)
+        print(f"{axis:<10} {' '.join(f'{name}={value:g}' for name, value in point.items()):<48} {row['frame_p50']:8.3f} p50 {row['frame_p99']:8.3f} p99 ms")
+
+    phases = [key for key in dict.fromkeys(key for row in rows for key in row) if key.endswith("_ms")]
+    with open(args.csv, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(dict.fromkeys(key for row in rows for key in row)), restval=0)
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"Wrote {os.path.abspath(args.csv)}")
+
+    # Where each sweep first goes over budget
+    for axis in dict.fromkeys(row["axis"] for row in rows):
+        over = [row for row in rows if row["axis"] == axis and row["frame_p99"] > FRAME_BUDGET_MS]
+        limit = f"p99 over budget from {min(row[ENTITY_COUNTS[axis]] for row in over)} {ENTITY_COUNTS[axis]}" if over else "always within budget"
+        print(f"{axis}: {limit}")
+
+    if args.plot:
+        plot(rows, phases, args.plot)
+        print(f"Wrote {os.path.abspath(args.plot)}")
+
+
+if __name__ == "__main__":
+    main()
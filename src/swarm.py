@@ -0,0 +1,148 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+from spatial import GridIndex
+
+AVOID_INFLATE = 15  # Plus up to AVOID_INFLATE_RANDOM, per axis
+AVOID_INFLATE_RANDOM = 10
+
+
+@dataclass
+class Swarm:
+    """Kinematics of all aliens in arrays, updated in one vectorized pass.
+
+    The Alien objects stay the interface for shooting, hits and drawing, their rects are written back after each update.
+    Only active aliens move, the rest wait in their pools to be spawned with activate()."""
+
+    aliens: list
+    grid: GridIndex
+    seed: int = 0
+    recycle: bool = True  # Aliens that fly off screen come back on the right, instead of being deactivated
+
+    def __post_init__(self):
+        self.rng = np.random.default_rng(self.seed)
+        self.x = np.array([alien.rect.x for alien in self.aliens], dtype=float)
+        self.y = np.array([alien.rect.y for alien in self.aliens], dtype=float)
+        self.width = np.array([alien.rect.width for alien in self.aliens], dtype=float)
+        self.height = np.array([alien.rect.height for alien in self.aliens], dtype=float)
+        self.last_x = np.full(len(self.aliens), np.nan)  # Nothing to smooth on the first update
+        self.last_y = np.full(len(self.aliens), np.nan)
+        self.speed = np.array([alien.speed for alien in self.aliens], dtype=float)
+        self.follow = np.array([alien.movement_style == "follow" for alien in self.aliens], dtype=bool)
+        self.opacity = np.array([alien.opacity for alien in self.aliens], dtype=float)
+        self.original_opacity = self.opacity.copy()
+        self.active = np.zeros(len(self.aliens), dtype=bool)
+        self.live = np.zeros(0, dtype=np.intp)
+
+    def activate(self, index: int, center_x: float, center_y: float):
+        alien = self.aliens[index]
+        alien.reset()
+        self.x[index] = alien.rect.x = center_x - self.width[index] / 2
+        self.y[index] = alien.rect.y = center_y - self.height[index] / 2
+        self.last_x[index] = np.nan
+        self.last_y[index] = np.nan
+        self.opacity[index] = self.original_opacity[index]
+        self.active[index] = True
+        self.live = np.flatnonzero(self.active)
+
+    def live_aliens(self) -> list:
+        return [self.aliens[i] for i in self.live.tolist()]
+
+    def avoidance(self, x: np.ndarray, y: np.ndarray, width: np.ndarray, height: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Push away from one random overlapping neighbor each, like the old per-alien loop did with the first hit in random order."""
+        count = len(x)
+        total_x = np.zeros(count)
+        total_y = np.zeros(count)
+        i, j = self.grid.pairs(x, y, width, height, AVOID_INFLATE + AVOID_INFLATE_RANDOM)
+
+        # Cheap test with the biggest possible inflate first, then the random inflate on what's left
+        margin = (AVOID_INFLATE + AVOID_INFLATE_RANDOM) / 2
+        close = (x[i] < x[j] + width[j] + margin) & (x[j] - margin < x[i] + width[i])
+        close &= (y[i] < y[j] + height[j] + margin) & (y[j] - margin < y[i] + height[i])
+        i = i[close]
+        j = j[close]
+        inflate_x = AVOID_INFLATE + self.rng.random(i.size) * AVOID_INFLATE_RANDOM
+        inflate_y = AVOID_INFLATE + self.rng.random(i.size) * AVOID_INFLATE_RANDOM
+        other_x = x[j] - inflate_x / 2
+        other_y = y[j] - inflate_y / 2
+        overlap = (x[i] < other_x + width[j] + inflate_x) & (other_x < x[i] + width[i])
+        overlap &= (y[i] < other_y + height[j] + inflate_y) & (other_y < y[i] + height[i])
+        i = i[overlap]
+        j = j[overlap]
+
+        # Random pick among the overlapping ones: shuffle, then take the first pair of each alien
+        shuffle = self.rng.permutation(i.size)
+        i = i[shuffle]
+        j = j[shuffle]
+        rows, first = np.unique(i, return_index=True)
+        others = j[first]
+        push = self.rng.random((2, rows.size))
+        total_x[rows] = np.where(x[rows] < x[others], -push[0], push[0] * 0.5)
+        total_y[rows] = np.where(y[rows] < y[others], -push[1] * 2, push[1] * 2)
+        return total_x, total_y
+
+    def update(self, dt: float, shift_x: float, shift_y: float, player_x: float, player_y: float, screen_width: float, screen_height: float) -> np.ndarray:
+        """Move the active aliens. Returns the ones that left and were deactivated, for their pools to take back."""
+        live = self.live
+        count = live.size
+        health = np.fromiter((self.aliens[i].health for i in live.tolist()), dtype=float, count=count)
+        x = self.x[live]
+        y = self.y[live]
+        last_x = self.last_x[live]
+        last_y = self.last_y[live]
+        opacity = self.opacity[live]
+
+        total_x, total_y = self.avoidance(x, y, self.width[live], self.height[live])
+
+        # Movement towards player
+        ratio_y = np.where(player_x < x, 0.75, 0.15)
+        total_y += np.where(self.follow[live], np.where(player_y > y, 1, -1) * self.rng.random(count) * ratio_y, 0)
+
+        # General movement
+        total_x -= 1.5 + self.rng.random(count) * 0.5
+
+        # Normalize the movement
+        distance = np.hypot(total_x, total_y)
+        moving = distance > 0
+        scale = np.divide(self.speed[live], distance, out=np.zeros(count), where=moving)
+        x += np.where(moving, total_x * scale * dt - shift_x, 0)
+        y += np.where(moving, total_y * scale * dt + shift_y, 0)
+
+        # Smoothing, lol
+        fresh = np.isnan(last_x)
+        last_x[fresh] = x[fresh]
+        last_y[fresh] = y[fresh]
+        x += (x - last_x) * 0.15
+        y += (y - last_y) * 0.15
+
+        opacity[health <= 0] -= 15 * dt  # Dead ones are invisible, this is only how long until they're gone
+
+        gone = x < -300
+        if self.recycle:
+            respawned = np.flatnonzero(gone)
+            departed = np.zeros(0, dtype=np.intp)
+            if respawned.size:
+                x[respawned] = screen_width + 300 + self.rng.random(respawned.size) * 500
+                y[respawned] = self.rng.integers(-100, screen_height + 100, respawned.size, endpoint=True)
+                opacity[respawned] = self.original_opacity[live[respawned]]
+        else:
+            respawned = np.zeros(0, dtype=np.intp)
+            departed = live[gone | (health <= 0) & (opacity <= 0)]  # Off screen, or faded out
+
+        self.x[live] = x
+        self.y[live] = y
+        self.last_x[live] = x
+        self.last_y[live] = y
+        self.opacity[live] = opacity
+
+        # Write back
+        for alien, ax, ay in zip(self.live_aliens(), x.tolist(), y.tolist()):
+            alien.rect.x = ax
+            alien.rect.y = ay
+        for i in live[respawned].tolist():
+            self.aliens[i].reset()
+        if departed.size:
+            self.active[departed] = False
+            self.live = np.flatnonzero(self.active)
+        return departed
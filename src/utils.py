@@ -1,7 +1,10 @@
+import numpy as np
 from pygame import Rect
 
 
 class FloatRect:
+    __slots__ = ("height", "width", "x", "y")
+
     def __init__(self, x, y, width, height):
         self.x = float(x)
         self.y = float(y)
@@ -26,11 +29,11 @@ class FloatRect:
 
     @property
     def topleft(self):
-        return (self.left, self.top)
+        return (self.x, self.y)
 
     @property
     def bottomright(self):
-        return (self.right, self.bottom)
+        return (self.x + self.width, self.y + self.height)
 
     @property
     def size(self):
@@ -51,28 +54,59 @@ class FloatRect:
     def inflate(self, x, y):
         return FloatRect(self.x - x / 2, self.y - y / 2, self.width + x, self.height + y)
 
+    def inflate_ip(self, x, y):
+        self.x -= x / 2
+        self.y -= y / 2
+        self.width += x
+        self.height += y
+
     def scale_by(self, factorx, factory):
         return FloatRect(self.x, self.y, self.width * factorx, self.height * factory)
 
+    def scale_by_ip(self, factorx, factory):
+        self.width *= factorx
+        self.height *= factory
+
     def move(self, x, y):
         return FloatRect(self.x + x, self.y + y, self.width, self.height)
 
+    def move_ip(self, x, y):
+        self.x += x
+        self.y += y
+
     def clamp(self, other):
-        # This method would be used to keep the rect within another
+        # Moved to be inside other, centered on an axis where it doesn't fit (like pygame's Rect.clamp)
         new_rect = self.copy()
-        if self.left < other.left:
-            new_rect.left = other.left
-        if self.right > other.right:
-            new_rect.right = other.right
-        if self.top < other.top:
-            new_rect.top = other.top
-        if self.bottom > other.bottom:
-            new_rect.bottom = other.bottom
+        new_rect.clamp_ip(other)
         return new_rect
 
+    def clamp_ip(self, other):
+        if self.width >= other.width:
+            self.x = other.x + (other.width - self.width) / 2
+        elif self.x < other.x:
+            self.x = other.x
+        elif self.x + self.width > other.x + other.width:
+            self.x = other.x + other.width - self.width
+
+        if self.height >= other.height:
+            self.y = other.y + (other.height - self.height) / 2
+        elif self.y < other.y:
+            self.y = other.y
+        elif self.y + self.height > other.y + other.height:
+            self.y = other.y + other.height - self.height
+
     def colliderect(self, other):
-        # Check for collision with another rect
-        return not (self.right <= other.left or self.left >= other.right or self.bottom <= other.top or self.top >= other.bottom)
+        # Check for collision with another rect, works for anything with x, y, width and height
+        return self.x < other.x + other.width and other.x < self.x + self.width and self.y < other.y + other.height and other.y < self.y + self.height
+
+    def collidelistall(self, rects):
+        """Indices of all rects this one collides with."""
+        return [i for i, rect in enumerate(rects) if self.colliderect(rect)]
+
+    def collidearray(self, boxes: np.ndarray) -> np.ndarray:
+        """Test against many rects at once, given as an (N, 4) array of x, y, width, height. Returns a boolean mask."""
+        x, y, width, height = boxes.T
+        return (self.x < x + width) & (x < self.x + self.width) & (self.y < y + height) & (y < self.y + self.height)
 
     def copy(self):
         return FloatRect(self.x, self.y, self.width, self.height)
@@ -85,4 +119,4 @@ class FloatRect:
         return FloatRect(rect.x, rect.y, rect.width, rect.height)
 
     def to_rect(self):
-        return Rect(round(self.left), round(self.top), round(self.width), round(self.height))
+        return Rect(round(self.x), round(self.y), round(self.width), round(self.height))
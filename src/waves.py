@@ -0,0 +1,145 @@
+import json
+import random
+import tomllib
+from dataclasses import dataclass, field
+from math import ceil
+
+
+@dataclass
+class AlienType:
+    image: str
+    sizes: tuple[int, int]  # Width range, each pooled alien rolls one and keeps its sprite scaled to it
+    health: int = 5
+    speed: tuple[float, float] = (4, 5)
+    targeting_style: str = "random"
+    movement_style: str = "follow"
+    pool: int | None = None  # Pool capacity, by default enough for all of this type's waves at once
+
+
+@dataclass
+class Wave:
+    at: float  # Game time in seconds
+    type: str
+    count: int
+    formation: str = "scatter"  # scatter, column or v
+    x: tuple[float, float] = (1440, 2940)  # Range of centers, formations are placed at a random point in it
+    y: tuple[float, float] = (100, 980)
+    spacing: float = 120
+
+
+@dataclass
+class Level:
+    types: dict[str, AlienType]
+    waves: list[Wave]
+    loop: float | None = None  # Start over after this many seconds
+    recycle: bool = False  # Aliens that fly off screen come back on the right, instead of going back to the pool
+
+    def pool_size(self, name: str) -> int:
+        alien_type = self.types[name]
+        if alien_type.pool is not None:
+            return alien_type.pool
+        return sum(wave.count for wave in self.waves if wave.type == name)
+
+    def counts(self) -> dict[str, int]:
+        return {name: sum(wave.count for wave in self.waves if wave.type == name) for name in self.types}
+
+
+def span(value) -> tuple[float, float]:
+    return (value, value) if isinstance(value, (int, float)) else tuple(value)
+
+
+def load_level(path: str) -> Level:
+    """Read a level from a .json or .toml file."""
+    with open(path, "rb") as f:
+        data = tomllib.load(f) if path.endswith(".toml") else json.load(f)
+    types = {name: AlienType(**(spec | {"sizes": span(spec["sizes"]), "speed": span(spec.get("speed", AlienType.speed))})) for name, spec in data["types"].items()}
+    waves = [Wave(**(spec | {"x": span(spec.get("x", Wave.x)), "y": span(spec.get("y", Wave.y))})) for spec in data["waves"]]
+    for wave in waves:
+        if wave.type not in types:
+            raise ValueError(f"{path}: wave at {wave.at} s uses unknown alien type {wave.type!r}")
+        if wave.formation not in FORMATIONS:
+            raise ValueError(f"{path}: unknown formation {wave.formation!r}, expected one of {', '.join(FORMATIONS)}")
+    waves.sort(key=lambda wave: wave.at)
+    return Level(types, waves, data.get("loop"), data.get("recycle", False))
+
+
+def scatter(wave: Wave) -> list[tuple[float, float]]:
+    return [(random.randint(int(wave.x[0]), int(wave.x[1])), random.randint(int(wave.y[0]), int(wave.y[1]))) for _ in range(wave.count)]
+
+
+def column(wave: Wave) -> list[tuple[float, float]]:
+    x = random.uniform(*wave.x)
+    y = random.uniform(*wave.y)
+    return [(x, y + (i - (wave.count - 1) / 2) * wave.spacing) for i in range(wave.count)]
+
+
+def v(wave: Wave) -> list[tuple[float, float]]:
+    """Leader in front (to the left), the rest trail behind it alternating above and below."""
+    x = random.uniform(*wave.x)
+    y = random.uniform(*wave.y)
+    return [(x + ceil(i / 2) * wave.spacing, y + ceil(i / 2) * wave.spacing * (-1 if i % 2 else 1)) for i in range(wave.count)]
+
+
+FORMATIONS = {
+    "scatter": scatter,
+    "column": column,
+    "v": v,
+}
+
+
+@dataclass
+class AlienPool:
+    """Free list over a preallocated range of the swarm's aliens, spawning never allocates."""
+
+    name: str
+    start: int
+    capacity: int
+    free: list[int] = field(default_factory=list)
+
+    # Stats
+    hits: int = 0
+    misses: int = 0  # Spawns dropped because every alien of the type was already out
+
+    def __post_init__(self):
+        self.free = list(reversed(range(self.start, self.start + self.capacity)))  # Hand out in order
+
+    def acquire(self) -> int | None:
+        if not self.free:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self.free.pop()
+
+    def release(self, index: int):
+        self.free.append(index)
+
+    @property
+    def live(self) -> int:
+        return self.capacity - len(self.free)
+
+    def stats(self) -> str:
+        spawns = self.hits + self.misses
+        return f"AlienPool {self.name}: {self.live}/{self.capacity} live, {self.hits} spawned, {self.misses} dropped, {self.hits / max(spawns, 1):.0%} hit rate"
+
+
+@dataclass
+class WaveScheduler:
+    """Hands out the waves whose time has come, looping the level if it says so."""
+
+    level: Level
+    next_wave: int = 0
+    loop_start: float = 0.0
+
+    def due(self, now: float) -> list[Wave]:
+        waves = []
+        while True:
+            if self.next_wave == len(self.level.waves):
+                if self.level.loop is None or now < self.loop_start + self.level.loop:
+                    return waves
+                self.loop_start += self.level.loop
+                self.next_wave = 0
+            wave = self.level.waves[self.next_wave]
+            if now < self.loop_start + wave.at:
+                return waves
+            waves.append(wave)
+            self.next_wave += 1
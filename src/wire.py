@@ -0,0 +1,96 @@
+import struct
+import zlib
+from dataclasses import dataclass, field
+
+import numpy as np
+
+NO_BASELINE = 0  # Ticks are server frames, which start at 1
+BASELINE_WINDOW = 64  # Ticks both sides keep states for, older baselines aren't used
+COUNTS = struct.Struct("<HHH")  # Removed, changed, added
+MAX_DATAGRAM = 65507  # Biggest UDP payload over IPv4, anything bigger fails with EMSGSIZE
+
+
+@dataclass
+class WorldState:
+    """One tick of the world as it goes over the wire. world is a few floats sent as is,
+    categories are entity ids (uint16) and their quantized fields (int16, one row per id), sorted by id."""
+
+    tick: int
+    world: np.ndarray
+    categories: dict[str, tuple[np.ndarray, np.ndarray]] = field(default_factory=dict)
+
+    def nbytes(self) -> int:
+        """Size without delta compression, to compare against."""
+        return self.world.nbytes + sum(ids.nbytes + values.nbytes for ids, values in self.categories.values())
+
+
+def quantize(values, scale: float = 1) -> np.ndarray:
+    return np.clip(np.rint(np.asarray(values, dtype=float) * scale), -32768, 32767).astype(np.int16)
+
+
+@dataclass
+class WorldCodec:
+    """Delta compression of world states: per category, the ids gone since the baseline, how the changed rows changed, and the new rows in full, then zlib over it all.
+
+    Deltas are taken in int16 and wrap around, so they're exact even for jumps. Columns go out one after another, which is what makes steady movement compress well."""
+
+    layout: dict[str, int]  # Category -> columns, both sides have to agree
+    world_size: int = 6
+    level: int = 1
+
+    def empty(self, tick: int = NO_BASELINE) -> WorldState:
+        return WorldState(tick, np.zeros(self.world_size, dtype=np.float32), {name: (np.zeros(0, dtype=np.uint16), np.zeros((0, columns), dtype=np.int16)) for name, columns in self.layout.items()})
+
+    def encode(self, state: WorldState, baseline: WorldState | None) -> bytes:
+        baseline = baseline or self.empty()
+        parts = [state.world.astype(np.float32).tobytes()]
+        for name in self.layout:
+            ids, values = state.categories[name]
+            base_ids, base_values = baseline.categories[name]
+            removed = np.setdiff1d(base_ids, ids, assume_unique=True)
+            common, mine, theirs = np.intersect1d(ids, base_ids, assume_unique=True, return_indices=True)
+            delta = values[mine] - base_values[theirs]
+            changed = delta.any(axis=1)
+            added = ~np.isin(ids, base_ids, assume_unique=True)
+            parts += [COUNTS.pack(len(removed), np.count_nonzero(changed), np.count_nonzero(added)), removed.astype(np.uint16).tobytes()]
+            parts += [common[changed].astype(np.uint16).tobytes(), delta[changed].T.tobytes(), ids[added].tobytes(), values[added].T.tobytes()]
+        return zlib.compress(b"".join(parts), self.level)
+
+    def coarser(self, state: WorldState) -> WorldState:
+        """The same state with the biggest category cut in half, for one that's too big to send."""
+        name = max(state.categories, key=lambda name: len(state.categories[name][0]))
+        ids, values = state.categories[name]
+        return WorldState(state.tick, state.world, state.categories | {name: (ids[: len(ids) // 2], values[: len(ids) // 2])})
+
+    def decode(self, tick: int, data: bytes, baseline: WorldState | None) -> WorldState:
+        baseline = baseline or self.empty()
+        data = zlib.decompress(data)
+        world = np.frombuffer(data, dtype=np.float32, count=self.world_size)
+        offset = world.nbytes
+        state = WorldState(tick, world)
+
+        def take(count: int, dtype, columns: int = 0) -> np.ndarray:
+            nonlocal offset
+            size = count * max(columns, 1)
+            array = np.frombuffer(data, dtype=dtype, count=size, offset=offset)
+            offset += array.nbytes
+            return array.reshape(columns, count).T if columns else array
+
+        for name, columns in self.layout.items():
+            removed_count, changed_count, added_count = COUNTS.unpack_from(data, offset)
+            offset += COUNTS.size
+            removed = take(removed_count, np.uint16)
+            changed = take(changed_count, np.uint16)
+            delta = take(changed_count, np.int16, columns)
+            added = take(added_count, np.uint16)
+            added_values = take(added_count, np.int16, columns)
+
+            base_ids, base_values = baseline.categories[name]
+            kept = ~np.isin(base_ids, removed, assume_unique=True)
+            ids, values = base_ids[kept], base_values[kept].copy()
+            values[np.searchsorted(ids, changed)] += delta
+            ids = np.concatenate([ids, added])
+            values = np.concatenate([values, added_values])
+            order = np.argsort(ids, kind="stable")
+            state.categories[name] = (ids[order], values[order])
+        return state